@@ -0,0 +1,152 @@
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from os import path
+from time import perf_counter_ns
+
+from utils import DiceRoller, DiceStream, V5DiceRoll, V5Roll
+
+# Dice subsystem benchmarks. Runs without Kivy:
+#   python bench_dice.py            compare time and peak memory against the baseline, exit code 1 on a regression
+#   python bench_dice.py --update   record a new baseline
+
+BASELINE_PATH = path.normpath(path.join(path.dirname(path.abspath(__file__)), "bench_dice_baseline.json"))
+MAX_POOL = 20
+MAX_HUNGER = 5
+DIFFICULTY = 3
+
+
+def messy_crit_roll(pool, hunger, dice):  # One black ten and one red ten, so reroll_messy_crit() is always allowed.
+    roll = V5Roll(pool, 0, hunger=hunger, dice=dice)
+    black_dice, red_dice = roll.black_pool, min(roll.hunger, roll.pool)
+    if black_dice < 1 or red_dice < 1:
+        return None
+    roll.black_faces = V5Roll.histogram([V5DiceRoll.D10_MAX] + [1] * (black_dice - 1))
+    roll.red_faces = V5Roll.histogram([V5DiceRoll.D10_MAX] + [2] * (red_dice - 1))
+    roll.calculate()
+    return roll
+
+
+def get_cases(pool, hunger, dice):
+    # Each case is (make_inputs, operation): make_inputs(n) builds n fresh inputs outside the timer, or returns None if
+    # the case can't happen at this pool and hunger. operation is the call being measured.
+    roller = DiceRoller(dice)
+
+    def no_inputs(count):
+        return [None] * count
+
+    def calc_inputs(count):
+        return [V5DiceRoll(pool, DIFFICULTY, hunger=hunger, dice=dice) for _ in range(count)]
+
+    def fail_inputs(count):
+        rolls = [V5Roll(pool, DIFFICULTY, hunger=hunger, dice=dice) for _ in range(count * 4)]
+        rolls = [roll for roll in rolls if roll.black_failures > 0][:count]
+        return rolls if len(rolls) == count else None
+
+    def messy_inputs(count):
+        rolls = [messy_crit_roll(pool, hunger, dice) for _ in range(count)]
+        return None if rolls[0] is None else rolls
+
+    def reroll_op(reroll_func):
+        def op(roll):
+            roller.current_roll = roll
+            return reroll_func()
+        return op
+
+    return {
+        "V5DiceRoll.__init__": (no_inputs, lambda _: V5DiceRoll(pool, DIFFICULTY, hunger=hunger, dice=dice)),
+        "V5DiceRoll.calculate": (calc_inputs, lambda roll: roll.calculate()),
+        "DiceRoller.test": (no_inputs, lambda _: roller.test(pool, DIFFICULTY, hunger=hunger)),
+        "DiceRoller.contest": (no_inputs, lambda _: roller.contest(pool, pool, hunger=hunger)),
+        "DiceRoller.reroll_fails": (fail_inputs, reroll_op(roller.reroll_fails)),
+        "DiceRoller.reroll_messy_crit": (messy_inputs, reroll_op(roller.reroll_messy_crit))
+    }
+
+
+def measure(make_inputs, operation, reps, rounds=3, alloc_reps=50):
+    ns_per_roll = None
+    for _ in range(rounds):  # Best of several rounds, like timeit, so one noisy round doesn't look like a regression.
+        inputs = make_inputs(reps)
+        if inputs is None:
+            return None
+        start = perf_counter_ns()
+        for item in inputs:
+            operation(item)
+        round_ns = (perf_counter_ns() - start) / reps
+        ns_per_roll = round_ns if ns_per_roll is None else min(ns_per_roll, round_ns)
+    inputs, alloc_total = make_inputs(alloc_reps), 0
+    tracemalloc.start()
+    for item in inputs:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = operation(item)
+        alloc_total += tracemalloc.get_traced_memory()[1] - before
+        del result
+    tracemalloc.stop()
+    return {"ns": round(ns_per_roll, 1), "alloc_bytes": round(alloc_total / alloc_reps, 1)}
+
+
+def run(reps, seed=0):
+    results, dice = {}, DiceStream(seed)
+    for pool in range(1, MAX_POOL + 1):
+        for hunger in range(MAX_HUNGER + 1):
+            for name, (make_inputs, operation) in get_cases(pool, hunger, dice).items():
+                result = measure(make_inputs, operation, reps)
+                if result:
+                    results["{}/pool{:02d}/hunger{}".format(name, pool, hunger)] = result
+    return results
+
+
+def compare(results, baseline, tolerance, alloc_tolerance):
+    # Compared per operation over all pool/hunger cases; single cases are too noisy to gate on by themselves.
+    totals = {}
+    for key, result in results.items():
+        if key in baseline:
+            name = key.split('/')[0]
+            ns, base_ns, alloc, base_alloc = totals.get(name, (0.0, 0.0, 0.0, 0.0))
+            totals[name] = (ns + result["ns"], base_ns + baseline[key]["ns"],
+                            alloc + result["alloc_bytes"], base_alloc + baseline[key]["alloc_bytes"])
+    found = []
+    for name, (ns, base_ns, alloc, base_alloc) in totals.items():
+        if ns > base_ns * (1 + tolerance):
+            found.append("{}: {:.2f}x the baseline time".format(name, ns / base_ns))
+        if alloc > base_alloc * (1 + alloc_tolerance):
+            found.append("{}: {} the baseline peak memory".format(
+                name, "{:.2f}x".format(alloc / base_alloc) if base_alloc else "{:.0f} bytes over".format(alloc)))
+    return found
+
+
+def summarize(results):
+    totals = {}
+    for key, result in results.items():
+        name = key.split('/')[0]
+        count, ns, alloc = totals.get(name, (0, 0.0, 0.0))
+        totals[name] = (count + 1, ns + result["ns"], alloc + result["alloc_bytes"])
+    for name, (count, ns, alloc) in totals.items():
+        print("{:<32} {:>10.0f} ns/roll {:>10.0f} peak bytes/roll  (mean of {} pool/hunger cases)".format(name, ns / count, alloc / count, count))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the V5 dice code.")
+    parser.add_argument("--reps", type=int, default=200, help="calls per round for each pool/hunger case")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown before an operation counts as a regression")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.1,
+                        help="allowed growth in peak memory per roll before an operation counts as a regression")
+    parser.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args()
+    bench_results = run(args.reps)
+    summarize(bench_results)
+    if args.update or not path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump({
+                "python": sys.version.split()[0], "platform": platform.platform(), "reps": args.reps, "results": bench_results
+            }, baseline_file, indent=1, sort_keys=True)
+        print("Baseline written to {}".format(BASELINE_PATH))
+    else:
+        with open(BASELINE_PATH, 'r') as baseline_file:
+            found = compare(bench_results, json.load(baseline_file)["results"], args.tolerance, args.alloc_tolerance)
+        for regression in found:
+            print("REGRESSION  " + regression)
+        sys.exit(1 if found else 0)
@@ -0,0 +1,44 @@
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count, listdir, makedirs, path, replace, stat
+
+from config import Config
+from game_events import ContentPack
+
+# Build step: parses and checks every script in text/ and json/ across a process pool, and writes data/content.pack.
+# The game loads events from the pack, so a shipped build never runs the script parser. Rerun this after editing scripts;
+# until then, any script that's newer than the pack is parsed from source as usual.
+
+
+def list_scripts():  # Biggest first, so one large script doesn't end up last in the queue.
+    scripts = []
+    for folder, ext in ((Config.PATH_TEXT_EVENTS, ".txt"), (Config.PATH_JSON_EVENTS, ".json")):
+        scripts += [(folder, file_name) for file_name in listdir(folder) if file_name.endswith(ext)]
+    return sorted(scripts, key=lambda script: -stat(path.normpath(script[0] + '/' + script[1])).st_size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompile every event script into " + ContentPack.FILE_NAME)
+    parser.add_argument("--jobs", type=int, default=cpu_count(), help="worker processes (default: one per core)")
+    args = parser.parse_args()
+    scripts = list_scripts()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        compiled = list(pool.map(ContentPack.compile_file, [s[0] for s in scripts], [s[1] for s in scripts]))
+    errors = ["{}: {}".format(source, error) for source, _, _, file_errors in compiled for error in file_errors]
+    try:
+        pack_bytes = ContentPack.build(compiled) if not errors else None
+    except ValueError as e:
+        errors.append(str(e))
+    if errors:
+        for error in errors:
+            print(error)
+        print("Content pack not written: {} errors.".format(len(errors)))
+        sys.exit(1)
+    makedirs(Config.PATH_DATA, exist_ok=True)
+    pack_path = path.normpath(Config.PATH_DATA + '/' + ContentPack.FILE_NAME)
+    with open(pack_path + ".tmp", 'wb') as pack_file:
+        pack_file.write(pack_bytes)
+    replace(pack_path + ".tmp", pack_path)
+    num_events = sum([len(events) for _, _, events, _ in compiled])
+    print("Wrote {} events from {} files ({} bytes) to {}".format(num_events, len(scripts), len(pack_bytes), pack_path))
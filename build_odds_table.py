@@ -0,0 +1,15 @@
+from os import makedirs, path
+
+from config import Config
+from dice_odds import V5OddsTable
+
+# Build step: precomputes every V5 outcome probability into data/v5_odds.bin, which the game memory-maps at runtime.
+# Rerun this whenever the dice rules in V5DiceRoll.calculate() or DiceRoller's rerolls change.
+
+if __name__ == '__main__':
+    makedirs(Config.PATH_DATA, exist_ok=True)
+    table_path = path.normpath(Config.PATH_DATA + '/' + V5OddsTable.FILE_NAME)
+    table_bytes = V5OddsTable.build()
+    with open(table_path, 'wb') as table_file:
+        table_file.write(table_bytes)
+    print("Wrote {} bytes of V5 odds to {}".format(len(table_bytes), table_path))
@@ -8,6 +8,8 @@ class Config:
     KEY_INPUT_ENABLED = False
     KEY_INPUT_WATCH = ascii_letters + digits
     SAVE_FILE_PREFIX = "Sofa_Baron_Save#"
+    EVENT_STEPS_PER_FRAME = 50  # Moments run back to back before the event loop lets the GUI draw a frame.
+    EVENT_MS_PER_FRAME = 8
 
     if hasattr(sys, "_MEIPASS"):
         WORKING_PATH = sys._MEIPASS
@@ -16,6 +18,8 @@ class Config:
     PATH_JSON = path.normpath(WORKING_PATH + "/json/")
     PATH_JSON_EVENTS = path.normpath(WORKING_PATH + "/json/")
     PATH_TEXT_EVENTS = path.normpath(WORKING_PATH + "/text/")
+    PATH_DATA = path.normpath(WORKING_PATH + "/data/")
+    PATH_CACHE = path.normpath(WORKING_PATH + "/cache/")
     PATH_IMAGES = path.normpath(WORKING_PATH + "/images/")
     PATH_GUI_IMAGES = path.normpath(WORKING_PATH + "/images/gui/")
 
@@ -1,14 +1,22 @@
+from array import array
+from functools import reduce
+from heapq import heapify, heappop, heappush
+from itertools import count
+from time import perf_counter
+
 from kivy.event import EventDispatcher
 from kivy.properties import BooleanProperty
 
 from config import Config
 from gui_widgets import GuiUtils
-from utils import Utils, ObjectWrapper, DiceRoller, V5DiceRoll
-from game_events import GameEvent, Moment, StandardEvents, EventParser
+from utils import Utils, ObjectWrapper, DiceRoller, DiceStream, V5DiceRoll, V5Roll
+from game_events import GameEvent, Moment, StandardEvents, EventParser, EventCache, EventLibrary, EventExpr
+from dice_odds import V5Odds
+from game_interface import GameInterface
 from player_character import PlayerChar
 
 
-class InGameClock:  # TODO: implement this later
+class InGameClock:  # In-game time, in minutes since the game started.
     DAY_MINUTES_MIN = 0
     DAY_MINUTES_MAX = 1439
 
@@ -24,13 +32,111 @@ class InGameClock:  # TODO: implement this later
     def time(self, new_time):
         self._time = new_time
 
+    @property
+    def day(self):
+        return self.time // (InGameClock.DAY_MINUTES_MAX + 1)
+
+    @property
+    def minute_of_day(self):
+        return self.time % (InGameClock.DAY_MINUTES_MAX + 1)
+
     def __iadd__(self, other):
         if Utils.is_number(other):
             self.time = self.time + int(other)
+        return self
+
+
+class EventScheduler:  # Events ordered by in-game time, then priority (lower first), then the order they were scheduled in.
+    PRIORITY_DEFAULT = 0
+
+    def __init__(self, clock: InGameClock):
+        self.clock = clock
+        self._heap = []  # [time, priority, seq, event], with event set to None once it's cancelled.
+        self._entries = {}  # event -> its live heap entry
+        self._seq = count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, event):
+        return event in self._entries
+
+    def __iter__(self):  # In the order they'll come up. O(n log n), so it's for debugging and the GUI, not the game loop.
+        return iter([entry[3] for entry in sorted(self._entries.values())])
+
+    def __repr__(self):
+        return "<EventScheduler @ {} :: {}>".format(self.clock.time, list(self))
+
+    def schedule(self, event, at=None, priority=PRIORITY_DEFAULT):  # at defaults to now; rescheduling moves the event.
+        if event in self._entries:
+            self.cancel(event)
+        entry = [self.clock.time if at is None else at, priority, next(self._seq), event]
+        self._entries[event] = entry
+        heappush(self._heap, entry)
+        return entry
+
+    def schedule_in(self, event, minutes, priority=PRIORITY_DEFAULT):
+        return self.schedule(event, at=self.clock.time + minutes, priority=priority)
+
+    def schedule_next(self, event):  # Ahead of everything else, e.g. the destination of an event jump.
+        head = self.peek_entry()
+        if head is None:
+            return self.schedule(event)
+        return self.schedule(event, at=min(head[0], self.clock.time), priority=min(head[1], EventScheduler.PRIORITY_DEFAULT) - 1)
+
+    def reschedule(self, event, at=None, priority=None):  # Keeps the event's current time and priority unless given new ones.
+        entry = self._entries.get(event)
+        if at is None and entry is not None:
+            at = entry[0]
+        if priority is None:
+            priority = entry[1] if entry is not None else EventScheduler.PRIORITY_DEFAULT
+        return self.schedule(event, at=at, priority=priority)
+
+    def cancel(self, event):  # Lazy removal: the heap entry stays behind, marked dead, until it reaches the top.
+        entry = self._entries.pop(event, None)
+        if entry is None:
+            return False
+        entry[3] = None
+        if len(self._heap) > 2 * len(self._entries) + 32:  # Mostly dead entries; rebuild so the heap doesn't bloat.
+            self._heap = [entry for entry in self._heap if entry[3] is not None]
+            heapify(self._heap)
+        return True
+
+    def peek_entry(self):
+        while self._heap and self._heap[0][3] is None:
+            heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def peek(self):  # The next event, whether or not it's due yet.
+        head = self.peek_entry()
+        return head[3] if head else None
+
+    def next_due(self, advance_clock=True):  # The next event; if it's in the future, the clock skips ahead to it.
+        head = self.peek_entry()
+        if head is None:
+            return None
+        if head[0] > self.clock.time:
+            if not advance_clock:
+                return None
+            self.clock.time = head[0]
+        return head[3]
+
+    def pop(self, advance_clock=True):
+        event = self.next_due(advance_clock)
+        if event is not None:
+            self.cancel(event)
+        return event
+
+    def get_time(self, event):
+        return self._entries[event][0] if event in self._entries else None
+
+    def clear(self):
+        self._heap, self._entries = [], {}
 
 
 class GameState(EventDispatcher):
     busy = BooleanProperty(False)
+    _versions = count(1)  # Shared by every GameState, so a version number never means two different states.
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -40,17 +146,22 @@ class GameState(EventDispatcher):
         self.session_number = 0
         self._hunger = 1
         self._humanity = 7
-        # self.game_clock = InGameClock(0)
+        self.game_clock = InGameClock(0)
         self.game_running = False
         self._current_event = None
-        self._event_queue = []
+        self._event_queue = EventScheduler(self.game_clock)
         self.temp_dice_roll_moment = None
         configvars = Config.__dict__
         self.attr_names = [getattr(Config, aname) for aname in configvars if str(aname).startswith("AT_")]
         self.skill_names = [getattr(Config, sname) for sname in configvars if str(sname).startswith("SK_")]
         self.discipline_names = [getattr(Config, dname) for dname in configvars if str(dname).startswith("DISC_")]
         self.playerchar = PlayerChar(anames=self.attr_names, snames=self.skill_names, dnames=self.discipline_names)
+        self.playerchar.on_change = self.touch
         self.current_roll = None
+        self.version = next(GameState._versions)
+
+    def touch(self):  # Marks the state as changed, so anything cached against the old version gets recomputed.
+        self.version = next(GameState._versions)
 
     @property
     def hunger(self):
@@ -117,13 +228,27 @@ class GameState(EventDispatcher):
 
 
 class CoreGame:
-    def __init__(self, gui):
+    READ_ONLY_FUNCS = ("get_pc_attr", "get_hunt_choice_label", "pc_can_hunt", "pc_can_delay_hunt", "pc_can_drink_swill",
+                       "pc_available_willpower")  # Toolkit functions whose results only depend on the game state.
+
+    def __init__(self, gui: GameInterface):
         self.gui = gui
+        self.num_moments = 0  # Moments handled this run, for benchmarks and headless playthroughs.
         self.state = GameState()
         self.dev_event_loop_tracker = 0
         self.log = None
-        self.dice_roller = DiceRoller()
+        self.dice = DiceStream()
+        self.dice_roller = DiceRoller(self.dice)
         self.current_roll_summary = None
+        self.roll_history = RollHistory()
+        self.toolkit = None  # (state version, toolkit) for the current version of the game state.
+        self.moment_handlers = {
+            Moment.M_TEXT_BLURB: self.have_text_blurb,
+            Moment.M_USER_CHOICE: self.have_user_choice,
+            Moment.M_DICE_ROLL: self.have_dice_roll,
+            Moment.M_STATE_CHANGE: self.have_state_change,
+            Moment.M_JUMP_2_EVENT: self.have_event_jump
+        }
 
     def player_input_unblock(self):
         if not self.state.busy:
@@ -157,17 +282,18 @@ class CoreGame:
         return self.state.game_running
 
     def load_next_event(self):
-        if len(self.state.event_queue) < 1:
-            return None
         while True:
-            new_event = self.state.event_queue.pop(0)  # NOTE: this makes it so that we aren't tracking the discarding of events.
+            new_event = self.state.event_queue.next_due()  # Stays scheduled until it's over; the clock moves up to it.
+            if new_event is None:
+                return None
             if self.validate_event(new_event):
                 break
+            self.state.event_queue.cancel(new_event)  # NOTE: this makes it so that we aren't tracking the discarding of events.
         self.state.current_event = new_event
         return self.state.current_event
 
     def load_standard_event(self, eid):
-        self.state.current_event = GameEvent.build_from_txt(filename="intro.txt", eid=eid)
+        self.state.current_event = EventCache.load_txt("intro.txt", eid=eid)
         return self.state.current_event
 
     def load_game(self, save_path=None):
@@ -179,7 +305,7 @@ class CoreGame:
             self.game_loop()
         else:  # New game, or if I don't get around to save/load functionality, every game.
             starting_event = self.load_standard_event("test_intro")
-            self.state.event_queue.append(starting_event)
+            self.state.event_queue.schedule(starting_event)
             self.state.game_id = Utils.generate_random_id_str(label=Config.SAVE_FILE_PREFIX)
             self.new_session()
             if Config.DEV_MODE:
@@ -187,101 +313,103 @@ class CoreGame:
             self.log = GameLog(self.state.session_id)
             self.game_loop(starting_event)
 
-    def im_having_a_moment(self):  # Returns mid for the next moment, or None if sequential.
+    def im_having_a_moment(self):  # Returns mid for the next moment (or None if sequential), and whether to wait for the player.
         moment = self.state.current_event.next_moment()
         if not moment:
             return None, False
         print("current moment we're having: ", moment)
-        mtype = Moment.validate_mtype(str(moment.type).lower())
-        # ---- Text blurbs
-        if mtype == Moment.M_TEXT_BLURB:
-            if moment.text and "{" in moment.text and "}" in moment.text:
-                m_text = Utils.get_excerpt(moment.text, "{", "}")
-                moment.text = EventParser.evaluate_event_param(Config.REF_TEXT, m_text, self.get_exposed_funcs())
-            if moment.text:
-                self.log.record(moment.text)
-                self.gui.main_text.read_line(moment.text)
-            if hasattr(moment, Config.REF_GOTO_MOMENT):
-                return getattr(moment, Config.REF_GOTO_MOMENT), True
-            return None, True  # A text blurb usually just points to the next moment, but blocks for user input.
-        # ---- Player choices
-        elif mtype == Moment.M_USER_CHOICE:
-            prompt, gui_choices = moment.text, []
-            for choice in moment.choices:
-                if Config.REF_CHOICE_ENABLED in choice:
-                    enabled = EventParser.evaluate_event_param(Config.REF_CHOICE_ENABLED, choice[Config.REF_CHOICE_ENABLED], self.get_exposed_funcs())
-                else:
-                    enabled = True
-                gui_choice = {
-                    Config.REF_TEXT: None,  # Required, but we have work to do first.
-                    Config.REF_GOTO_MOMENT: choice[Config.REF_GOTO_MOMENT],  # Required
-                    Config.REF_CHOICE_ENABLED: enabled
-                }
-                text_val = choice[Config.REF_CHOICE_LABEL]
-                if isinstance(text_val, dict) and Config.REF_EVAL_TAG in text_val:
-                    gui_choice[Config.REF_TEXT] = EventParser.evaluate_event_param(
-                        Config.REF_CHOICE_LABEL, text_val[Config.REF_EVAL_TAG], self.get_exposed_funcs()
-                    )
-                elif isinstance(text_val, str):
-                    gui_choice[Config.REF_TEXT] = text_val
-                else:
-                    raise ValueError("Choice labels should be either strings or specific dictionaries.")
-                if Config.REF_CHOICE_RID in choice:
-                    gui_choice[Config.REF_CHOICE_RID] = choice[Config.REF_CHOICE_RID]
-                # if Config.REF_CHOICE_SHOWN not in choice or CoreGame.evaluate_choice_shown(choice[Config.REF_CHOICE_SHOWN]):
-                if Config.REF_CHOICE_SHOWN not in choice or \
-                        EventParser.evaluate_event_param(Config.REF_CHOICE_SHOWN, choice[Config.REF_CHOICE_SHOWN], self.get_exposed_funcs()):
-                    gui_choices.append(gui_choice)
-            self.gui.main_text.prep_choices()
-            self.gui.main_text.create_choice_labels(gui_choices, prompt)
-            return None, True
-            # raise NotImplemented("Choices are not yet implemented!")
-        # ---- V5 dice roll contest
-        elif mtype == Moment.M_DICE_ROLL:
-            self.gui.main_text.prep_roll()
-            self.gui.dice_box.prep_roll()
-            self.current_roll_summary = self.get_roll_summary_object(moment.pool, True if moment.opp_pool else False)
-            if moment.opp_pool:
-                self.state.current_roll = self.dice_roller.contest(
-                    pool1=self.current_roll_summary.num_dice, pool2=moment.opp_pool, hunger=self.state.hunger
-                )
-            elif moment.difficulty:
-                self.state.current_roll = self.dice_roller.test(
-                    self.current_roll_summary.num_dice, difficulty=moment.difficulty, hunger=self.state.hunger
-                )
-            else:
-                raise AttributeError("Dice Roll moment must have either an opposition pool or flat difficulty!")
-            self.current_roll_summary.can_reroll_to_improve = self.dice_roller.can_reroll_to_improve
-            self.current_roll_summary.can_reroll_to_avert_mc = self.dice_roller.can_reroll_to_avert_mc
-            self.gui.display_roll(self.current_roll_summary, self.state.current_roll)
-            return None, True
-            # raise NotImplemented("Dice rolls are not yet implemented!")
-        # ---- Order to change game state
-        elif mtype == Moment.M_STATE_CHANGE:
-            if moment.result_func:
-                moment.result_func(self.state)  # NOTE: Would need to limit this to toolkit functions if result_func could be loaded from file.
+        self.num_moments += 1
+        handler = self.moment_handlers.get(Moment.get_mtype(moment.type))
+        if handler is None:
+            raise ValueError("Tried to handle a Moment of an invalid type, \"{}\"!".format(moment.type))
+        return handler(moment)
+
+    def have_text_blurb(self, moment):
+        if moment.text:
+            text = EventParser.compile_template(moment.text).render(self.state.version, self.get_exposed_funcs)
+            self.log.record(text)
+            self.gui.show_text(text)
+        if hasattr(moment, Config.REF_GOTO_MOMENT):
+            return getattr(moment, Config.REF_GOTO_MOMENT), True
+        return None, True  # A text blurb usually just points to the next moment, but blocks for user input.
+
+    def have_user_choice(self, moment):
+        prompt, gui_choices = moment.text, []
+        for choice in moment.choices:
+            if Config.REF_CHOICE_ENABLED in choice:
+                enabled = EventParser.evaluate_event_param(Config.REF_CHOICE_ENABLED, choice[Config.REF_CHOICE_ENABLED], self.get_exposed_funcs())
             else:
-                EventParser.evaluate_event_param(Config.REF_STATE_CHANGE_EXPR, moment.expr, self.get_exposed_funcs())
-            if moment.text:
-                self.log.record(moment.text)
-                self.gui.main_text.read_line(moment.text)
-            block = True if moment.text else False
-            if hasattr(moment, Config.REF_GOTO_MOMENT):
-                return getattr(moment, Config.REF_GOTO_MOMENT), block
-            return None, block
-            # raise NotImplemented("State changes are not yet implemented!")
-        elif mtype == Moment.M_JUMP_2_EVENT:
-            evts = [attr_name for attr_name in vars(GameEvent) if str(attr_name).startswith("EVT")]
-            if moment.destination_eid in evts:
-                the_event = StandardEvents.get_standard_event(moment.destination_eid, self.state)
+                enabled = True
+            gui_choice = {
+                Config.REF_TEXT: None,  # Required, but we have work to do first.
+                Config.REF_GOTO_MOMENT: choice[Config.REF_GOTO_MOMENT],  # Required
+                Config.REF_CHOICE_ENABLED: enabled
+            }
+            text_val = choice[Config.REF_CHOICE_LABEL]
+            if isinstance(text_val, dict) and Config.REF_EVAL_TAG in text_val:
+                gui_choice[Config.REF_TEXT] = EventParser.evaluate_event_param(
+                    Config.REF_CHOICE_LABEL, text_val[Config.REF_EVAL_TAG], self.get_exposed_funcs()
+                )
+            elif isinstance(text_val, str):
+                gui_choice[Config.REF_TEXT] = text_val
             else:
-                the_event = None  # TODO: implement this, search event queue?
-            self.state.event_queue.remove(self.state.current_event)
-            self.state.event_queue.insert(0, the_event)
-            self.state.current_event = the_event
-            return None, False
+                raise ValueError("Choice labels should be either strings or specific dictionaries.")
+            if Config.REF_CHOICE_RID in choice:
+                gui_choice[Config.REF_CHOICE_RID] = choice[Config.REF_CHOICE_RID]
+            # if Config.REF_CHOICE_SHOWN not in choice or CoreGame.evaluate_choice_shown(choice[Config.REF_CHOICE_SHOWN]):
+            if Config.REF_CHOICE_SHOWN not in choice or \
+                    EventParser.evaluate_event_param(Config.REF_CHOICE_SHOWN, choice[Config.REF_CHOICE_SHOWN], self.get_exposed_funcs()):
+                gui_choices.append(gui_choice)
+        self.gui.show_choices(gui_choices, prompt)
+        return None, True
+
+    def have_dice_roll(self, moment):  # V5 dice roll contest
+        self.current_roll_summary = self.get_roll_summary_object(moment.pool, True if moment.opp_pool else False)
+        if moment.opp_pool:
+            self.current_roll_summary.odds = V5Odds.contest_odds(
+                self.current_roll_summary.num_dice, moment.opp_pool, hunger=self.state.hunger
+            )
+            self.state.current_roll = self.dice_roller.contest(
+                pool1=self.current_roll_summary.num_dice, pool2=moment.opp_pool, hunger=self.state.hunger
+            )
+        elif moment.difficulty:
+            self.current_roll_summary.odds = V5Odds.outcome_odds(
+                self.current_roll_summary.num_dice, moment.difficulty, hunger=self.state.hunger
+            )
+            self.state.current_roll = self.dice_roller.test(
+                self.current_roll_summary.num_dice, difficulty=moment.difficulty, hunger=self.state.hunger
+            )
+        else:
+            raise AttributeError("Dice Roll moment must have either an opposition pool or flat difficulty!")
+        self.roll_history.record(self.state.current_roll)
+        self.current_roll_summary.can_reroll_to_improve = self.dice_roller.can_reroll_to_improve
+        self.current_roll_summary.can_reroll_to_avert_mc = self.dice_roller.can_reroll_to_avert_mc
+        self.gui.show_roll(self.current_roll_summary, self.state.current_roll)
+        return None, True
+
+    def have_state_change(self, moment):  # Order to change game state
+        if moment.result_func:
+            moment.result_func(self.state)  # NOTE: Would need to limit this to toolkit functions if result_func could be loaded from file.
+        else:
+            EventParser.evaluate_event_param(Config.REF_STATE_CHANGE_EXPR, moment.expr, self.get_exposed_funcs())
+        self.state.touch()
+        if moment.text:
+            self.log.record(moment.text)
+            self.gui.show_text(moment.text)
+        block = True if moment.text else False
+        if hasattr(moment, Config.REF_GOTO_MOMENT):
+            return getattr(moment, Config.REF_GOTO_MOMENT), block
+        return None, block
+
+    def have_event_jump(self, moment):
+        if moment.destination_eid in GameEvent.STANDARD_EIDS:
+            the_event = StandardEvents.get_standard_event(moment.destination_eid, self)
         else:
-            raise ValueError("Tried to handle a Moment of an invalid type, \"{}\"!".format(mtype))
+            the_event = EventLibrary.load_event(moment.destination_eid)  # One dict lookup, not a scan of every script.
+        self.state.event_queue.cancel(self.state.current_event)
+        self.state.event_queue.schedule_next(the_event)
+        self.state.current_event = the_event
+        return None, False
 
     def reroll(self, messy_crit=False):
         if not messy_crit:
@@ -290,11 +418,17 @@ class CoreGame:
             self.dice_roller.reroll_messy_crit()
         # cr, crs = self.dice_roller.current_roll, self.current_roll_summary
         self.deal_damage(Config.TRACK_WILL, Config.DMG_FULL_SPF, 1)
+        self.roll_history.amend(self.state.current_roll, willpower_spent=1)
         self.confirm_roll()
 
     def confirm_roll(self):
         outcome, margin = self.state.current_roll.outcome, self.state.current_roll.margin
-        roll_moment, actual_outcome_mid = self.state.temp_dice_roll_moment, None
+        actual_outcome_mid = CoreGame.get_roll_outcome_mid(self.state.temp_dice_roll_moment, outcome)
+        self.state.current_event.repoint(mid=actual_outcome_mid, mindex=None)
+
+    @staticmethod
+    def get_roll_outcome_mid(roll_moment, outcome):  # Where a roll moment goes for each outcome; None means the next moment.
+        actual_outcome_mid = None
         if outcome == V5DiceRoll.RESULT_WIN:
             actual_outcome_mid = roll_moment.mid_win
         elif outcome == V5DiceRoll.RESULT_FAIL:
@@ -313,7 +447,7 @@ class CoreGame:
             actual_outcome_mid = roll_moment.mid_beastfail
             if actual_outcome_mid is None:
                 actual_outcome_mid = roll_moment.mid_lose
-        self.state.current_event.repoint(mid=actual_outcome_mid, mindex=None)
+        return actual_outcome_mid
 
     def get_roll_summary_object(self, pool_text, has_opp=False):
         roll_obj, pool_stats, num_dice = {}, str(pool_text).split('+'), 0
@@ -356,23 +490,41 @@ class CoreGame:
 
     def current_event_repoint(self, target_mindex=None, target_mid=None):
         print("self.state.current_event = {}".format(self.state.current_event))
-        print("self.state.event_queue:", self.state.event_queue)
+        print("self.state.event_queue: {} events, next up {}".format(len(self.state.event_queue), self.state.event_queue.peek()))
         self.state.current_event.repoint(mindex=target_mindex, mid=target_mid)
 
-    def handle_game_event(self, special_event=None):
+    def handle_game_event(self, special_event=None, resumed=False):  # Runs moments in a loop until one waits for the player.
+        steps, deadline = 0, perf_counter() + Config.EVENT_MS_PER_FRAME / 1000
+        self.state.busy = False
+        while True:
+            try:
+                blocked_for_input = self.event_step(special_event)
+            except Exception as e:
+                if steps == 0 and not resumed:  # A resumed run has no caller to catch it.
+                    raise
+                Utils.log("Unexplained {} occurred in game event handler, tracker # is {}.".format(e.__class__, self.dev_event_loop_tracker), e)
+                return
+            special_event, steps = None, steps + 1
+            if blocked_for_input:
+                return
+            if steps >= Config.EVENT_STEPS_PER_FRAME or perf_counter() >= deadline:
+                self.state.busy = True  # Let the GUI draw a frame; player input waits until the run is done.
+                self.gui.schedule(lambda: self.handle_game_event(resumed=True))
+                return
+
+    def event_step(self, special_event=None):  # Handles one moment. Returns True if the game should wait for the player.
         self.dev_event_loop_tracker += 1
         event = special_event if special_event else self.state.current_event
         if not event:
-            return
+            return True
         Utils.log("Handling event: {}".format(event.__repr__()))
         if event.index >= len(event.itinerary) and not special_event:
-            if len(self.state.event_queue) > 0:
-                self.state.event_queue.pop(0)  # TODO: del delete this event? is it possible/desirable?
+            self.state.event_queue.cancel(event)  # TODO: del delete this event? is it possible/desirable?
             if len(self.state.event_queue) < 1:
                 self.handle_empty_event_queue()
-                return
+                return False
             self.state.current_event = None
-            return
+            return True
         next_moment_id, blocked_for_input = self.im_having_a_moment()
         print("We had a moment, returning: ", next_moment_id, blocked_for_input)
         if not blocked_for_input or event.itinerary[event.index].type != Moment.M_DICE_ROLL:  # Waits to call event.repoint() for dice roll moments.
@@ -380,12 +532,7 @@ class CoreGame:
         else:
             self.state.current_event = event  # NOTE: Special events should not be dice rolls.
             self.state.temp_dice_roll_moment = event.itinerary[event.index]
-
-        if not blocked_for_input:
-            try:
-                self.handle_game_event()
-            except Exception as e:
-                Utils.log("Unexplained {} occurred in game event handler, tracker # is {}.".format(e.__class__, self.dev_event_loop_tracker), e)
+        return blocked_for_input
 
     def game_loop(self, special_event=None):
         if not self.state.current_event:
@@ -398,24 +545,24 @@ class CoreGame:
         else:
             self.handle_game_event()
 
-    def handle_empty_event_queue(self):
+    def handle_empty_event_queue(self):  # Queues up whatever comes next; the caller carries on running it.
         Utils.log("We've reached the end of the event queue.")
         pass  # TODO: implement default haven event
         if self.state.playerchar.clan and self.state.playerchar.predator_type:
             back_to_haven = StandardEvents.get_standard_haven_hub_event(self)
-            self.state.event_queue.append(back_to_haven)
+            self.state.event_queue.schedule(back_to_haven)
         else:
             print("We're missing either a clan ({}) or predator type ({})!".format(self.state.playerchar.clan, self.state.playerchar.predator_type))
             # init_post_intro = NonStandardEvents.get_test_playerchar_event(gamestate=self.state)
-            init_post_intro = GameEvent.build_from_txt("clan_pt_choice.txt", eid="whatevs")
-            self.state.event_queue.append(init_post_intro)
-        self.state.current_event = self.state.event_queue[0]
-        self.game_loop()
+            init_post_intro = EventCache.load_txt("clan_pt_choice.txt", eid="whatevs")
+            self.state.event_queue.schedule(init_post_intro)
+        self.state.current_event = self.state.event_queue.next_due()
 
     def new_session(self):
         sesh = int(self.state.session_number)
         self.state.session_id = "{}-S#{}".format(self.state.game_id, str(sesh + 1).zfill(5))
-        self.gui.pc_ref = self.state.playerchar
+        self.dice.reseed(self.state.session_id)  # Same session id, same dice; handy for reproducing bugs.
+        self.gui.set_player_char(self.state.playerchar)
         if self.log:
             self.log.s_id = self.state.session_id
 
@@ -444,19 +591,33 @@ class CoreGame:
         self.state.playerchar.apply_background(background=bg)
         self.gui.refresh_screen("tab_charsheet")
 
-    def get_exposed_funcs(self):
-        return ObjectWrapper.wrap_dict_in_obj({
-            "set_hunger": self.set_hunger,
-            "choose_clan": self.state.playerchar.choose_clan,
-            "choose_pt": self.choose_predator_type_wrapper,
-            "get_pc_attr": self.state.get_pc_attr,
-            "add_background": self.add_background_wrapper,
-            "get_hunt_choice_label": self.state.get_hunt_choice_label,
-            "pc_can_hunt": self.state.pc_can_hunt,
-            "pc_can_delay_hunt": self.state.pc_can_delay_hunt,
-            "pc_can_drink_swill": self.state.pc_can_drink_swill,
-            "pc_available_willpower": self.available_pc_will
-        })
+    def get_exposed_funcs(self):  # One toolkit per state version, so a hub full of choices doesn't rebuild it each time.
+        if self.toolkit is None or self.toolkit[0] != self.state.version:
+            self.toolkit = (self.state.version, self.build_toolkit())
+        return self.toolkit[1]
+
+    def build_toolkit(self):  # NOTE: Scripts can only call names in EventExpr.TOOLKIT_FUNCS.
+        version = self.state.version
+        funcs = {name: reduce(getattr, attr_path.split('.'), self) for name, attr_path in EventExpr.TOOLKIT_FUNCS.items()}
+        for name in CoreGame.READ_ONLY_FUNCS:
+            funcs[name] = self.memoize(funcs[name], version)
+        return ObjectWrapper.wrap_dict_in_obj(funcs)
+
+    def memoize(self, func, version):  # Each distinct call is made once per state version.
+        results = {}
+
+        def memoized(*args, **kwargs):
+            if self.state.version != version:
+                return func(*args, **kwargs)  # Something in the same expression changed the state; don't trust old results.
+            key = (args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:  # Unhashable arguments, e.g. a list literal.
+                return func(*args, **kwargs)
+            if key not in results:
+                results[key] = func(*args, **kwargs)
+            return results[key]
+        return memoized
 
     def load_test_char_1(self):
         self.state.playerchar.choose_clan(Config.CLAN_NOSFERATU)
@@ -487,3 +648,81 @@ class GameLog:
 
     def load(self):
         raise NotImplemented("No log loading yet.")
+
+
+class RollHistory:  # Bounded, columnar record of recent rolls, plus running stats that cover every roll this session.
+    CAPACITY = 256
+    NUM_FACES = V5DiceRoll.D10_MAX + 1
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.pools, self.difficulties, self.hungers = array('B', bytes(capacity)), array('B', bytes(capacity)), array('B', bytes(capacity))
+        self.outcomes, self.margins, self.rerolls = array('B', bytes(capacity)), array('b', bytes(capacity)), array('B', bytes(capacity))
+        self.black_faces = array('B', bytes(capacity * RollHistory.NUM_FACES))  # One face histogram per row, like V5Roll.
+        self.red_faces = array('B', bytes(capacity * RollHistory.NUM_FACES))
+        self.total_rolls = 0  # Rows are written round-robin, so the newest row is at (total_rolls - 1) % capacity.
+        self.rolls_by_pool, self.wins_by_pool = {}, {}
+        self.messy_crits = 0
+        self.willpower_spent = 0
+
+    def __len__(self):
+        return min(self.total_rolls, self.capacity)
+
+    def record(self, roll):
+        row = self.total_rolls % self.capacity
+        self.total_rolls += 1
+        self.pools[row], self.difficulties[row] = max(0, min(roll.pool, 255)), max(0, min(roll.difficulty, 255))
+        self.hungers[row] = roll.hunger
+        self.rolls_by_pool[self.pools[row]] = self.rolls_by_pool.get(self.pools[row], 0) + 1
+        self.write_result(row, roll)
+        self.tally(row, 1)
+
+    def amend(self, roll, willpower_spent=1):  # Rewrites the newest row after a reroll.
+        row = (self.total_rolls - 1) % self.capacity
+        self.tally(row, -1)
+        self.write_result(row, roll)
+        self.tally(row, 1)
+        self.willpower_spent += willpower_spent
+
+    def write_result(self, row, roll):
+        self.outcomes[row] = V5DiceRoll.OUTCOMES.index(roll.outcome)
+        self.margins[row] = max(-128, min(roll.margin, 127))
+        self.rerolls[row] = roll.rerolled
+        start, end = row * RollHistory.NUM_FACES, (row + 1) * RollHistory.NUM_FACES
+        self.black_faces[start:end] = V5Roll.histogram(roll.black_results)
+        self.red_faces[start:end] = V5Roll.histogram(roll.red_results)
+
+    def tally(self, row, delta):  # Running stats, so nothing has to be recounted when the screen asks for them.
+        outcome = V5DiceRoll.OUTCOMES[self.outcomes[row]]
+        if outcome in (V5DiceRoll.RESULT_WIN, V5DiceRoll.RESULT_CRIT, V5DiceRoll.RESULT_MESSY_CRIT):
+            self.wins_by_pool[self.pools[row]] = self.wins_by_pool.get(self.pools[row], 0) + delta
+        if outcome == V5DiceRoll.RESULT_MESSY_CRIT:
+            self.messy_crits += delta
+
+    def success_rate(self, pool=None):
+        if pool is None:
+            rolls, wins = sum(self.rolls_by_pool.values()), sum(self.wins_by_pool.values())
+        else:
+            rolls, wins = self.rolls_by_pool.get(pool, 0), self.wins_by_pool.get(pool, 0)
+        return wins / rolls if rolls else None
+
+    def get_row(self, age=0):  # age 0 is the newest roll still in the buffer.
+        if age >= len(self):
+            raise IndexError("Roll history only holds {} rolls.".format(len(self)))
+        row = (self.total_rolls - 1 - age) % self.capacity
+        start, end = row * RollHistory.NUM_FACES, (row + 1) * RollHistory.NUM_FACES
+        return ObjectWrapper(
+            pool=self.pools[row], difficulty=self.difficulties[row], hunger=self.hungers[row],
+            outcome=V5DiceRoll.OUTCOMES[self.outcomes[row]], margin=self.margins[row], rerolled=bool(self.rerolls[row]),
+            black_results=V5Roll.expand(self.black_faces[start:end]), red_results=V5Roll.expand(self.red_faces[start:end])
+        )
+
+    def recent(self, count=10):  # Oldest first.
+        return [self.get_row(age) for age in range(min(count, len(self)) - 1, -1, -1)]
+
+    def summary(self):
+        rate = self.success_rate()
+        by_pool = ", ".join(["{}d: {:.0%}".format(pool, self.success_rate(pool)) for pool in sorted(self.rolls_by_pool)])
+        return "Rolls: {}  |  Success: {}  |  Messy crits: {}  |  Willpower spent: {}\n{}".format(
+            self.total_rolls, "-" if rate is None else "{:.0%}".format(rate), self.messy_crits, self.willpower_spent, by_pool
+        )
@@ -0,0 +1,315 @@
+import struct
+import sys
+from array import array
+
+from config import Config
+from utils import Utils, ObjectWrapper, V5DiceRoll
+
+
+class V5Odds:  # Exact outcome probabilities for V5DiceRoll, using the same rules as V5DiceRoll.calculate().
+    D10_FACES = (  # (successes, tens, ones, probability) for each kind of face on a single d10.
+        (0, 0, 0, 0.4), (0, 0, 1, 0.1), (1, 0, 0, 0.4), (1, 1, 0, 0.1)
+    )
+    MAX_POOL = 20
+    MAX_DIFFICULTY = 10
+    MAX_REROLLS = 3
+
+    table = None  # Precomputed V5OddsTable, checked before computing anything.
+    _table_checked = False
+    _states = {}  # (black dice, red dice) -> {(num_successes, crit, red ten, red one): probability}
+    _reroll_states = {}  # (black dice, red dice) -> same as _states, after rerolling failures whenever possible.
+    _outcomes = {}  # (pool, hunger, difficulty) -> {outcome: probability}
+    _reroll_outcomes = {}  # (reroll type, pool, hunger, difficulty) -> {outcome: probability}
+    _contests = {}  # (pool, opposing pool, hunger) -> ({outcome: probability}, {margin: probability})
+
+    @staticmethod
+    def dice_split(pool, hunger=1, include_hunger=True):  # Mirrors how V5DiceRoll.__init__() splits a pool.
+        pool, hunger = int(pool), int(hunger) if include_hunger else 0
+        if not include_hunger:
+            return max(pool, 0), 0
+        return max(pool - max(hunger, 0), 0), max(min(hunger, pool), 0)
+
+    @staticmethod
+    def get_table():
+        if not V5Odds._table_checked:
+            V5Odds._table_checked = True
+            V5Odds.table = V5OddsTable.load()
+        return V5Odds.table
+
+    @staticmethod
+    def face_counts(num_dice, track_ones=False):
+        # DP over dice: {(successes, tens, any ones): probability}. Only faces that matter to calculate() are tracked.
+        counts = {(0, 0, False): 1.0}
+        for _ in range(num_dice):
+            next_counts = {}
+            for (succ, tens, ones), prob in counts.items():
+                for f_succ, f_tens, f_ones, f_prob in V5Odds.D10_FACES:
+                    key = (succ + f_succ, tens + f_tens, ones or (track_ones and f_ones > 0))
+                    next_counts[key] = next_counts.get(key, 0.0) + prob * f_prob
+            counts = next_counts
+        return counts
+
+    @staticmethod
+    def settle(succ, tens, red_ten, red_one):  # Tallies dice the way calculate() does, including the crit bonus.
+        crit = tens > 1
+        return (succ + tens if crit else succ), crit, red_ten, red_one
+
+    @staticmethod
+    def combine(black_counts, red_counts):
+        states = {}
+        for (b_succ, b_tens, _), b_prob in black_counts.items():
+            for (r_succ, r_tens, r_ones), r_prob in red_counts.items():
+                state = V5Odds.settle(b_succ + r_succ, b_tens + r_tens, r_tens > 0, r_ones)
+                states[state] = states.get(state, 0.0) + b_prob * r_prob
+        return states
+
+    @staticmethod
+    def roll_states(pool, hunger=1, include_hunger=True):
+        key = V5Odds.dice_split(pool, hunger, include_hunger)
+        if key not in V5Odds._states:
+            V5Odds._states[key] = V5Odds.combine(V5Odds.face_counts(key[0]), V5Odds.face_counts(key[1], track_ones=True))
+        return V5Odds._states[key]
+
+    @staticmethod
+    def reroll_fails_states(pool, hunger=1, include_hunger=True):  # DiceRoller.reroll_fails() taken whenever it's offered.
+        key = V5Odds.dice_split(pool, hunger, include_hunger)
+        if key in V5Odds._reroll_states:
+            return V5Odds._reroll_states[key]
+        black_dice, black_counts = key[0], {}
+        for (succ, tens, _), prob in V5Odds.face_counts(black_dice).items():
+            for (r_succ, r_tens, _), r_prob in V5Odds.face_counts(min(V5Odds.MAX_REROLLS, black_dice - succ)).items():
+                black_key = (succ + r_succ, tens + r_tens, False)
+                black_counts[black_key] = black_counts.get(black_key, 0.0) + prob * r_prob
+        V5Odds._reroll_states[key] = V5Odds.combine(black_counts, V5Odds.face_counts(key[1], track_ones=True))
+        return V5Odds._reroll_states[key]
+
+    @staticmethod
+    def classify(margin, crit, red_ten, red_one):  # Same branching as the end of V5DiceRoll.calculate().
+        if margin >= 0:
+            if red_ten and crit:
+                return V5DiceRoll.RESULT_MESSY_CRIT
+            elif crit:
+                return V5DiceRoll.RESULT_CRIT
+            return V5DiceRoll.RESULT_WIN
+        if red_one:
+            return V5DiceRoll.RESULT_BESTIAL_FAIL
+        return V5DiceRoll.RESULT_FAIL
+
+    @staticmethod
+    def tally_outcomes(states, difficulty):
+        odds = {outcome: 0.0 for outcome in V5DiceRoll.OUTCOMES}
+        for (num_successes, crit, red_ten, red_one), prob in states.items():
+            odds[V5Odds.classify(num_successes - difficulty, crit, red_ten, red_one)] += prob
+        return odds
+
+    @staticmethod
+    def outcome_odds(pool, difficulty, hunger=1, include_hunger=True):
+        key = (int(pool), int(hunger) if include_hunger else 0, int(difficulty))
+        if key in V5Odds._outcomes:
+            return V5Odds._outcomes[key]
+        odds = V5Odds.get_table() and V5Odds.table.lookup(V5OddsTable.T_ROLL, *key)
+        if not odds:
+            odds = V5Odds.tally_outcomes(V5Odds.roll_states(key[0], key[1]), key[2])
+        V5Odds._outcomes[key] = odds
+        return odds
+
+    @staticmethod
+    def reroll_fails_odds(pool, difficulty, hunger=1, include_hunger=True):
+        key = (V5OddsTable.T_REROLL_FAILS, int(pool), int(hunger) if include_hunger else 0, int(difficulty))
+        if key in V5Odds._reroll_outcomes:
+            return V5Odds._reroll_outcomes[key]
+        odds = V5Odds.get_table() and V5Odds.table.lookup(*key)
+        if not odds:
+            odds = V5Odds.tally_outcomes(V5Odds.reroll_fails_states(key[1], key[2]), key[3])
+        V5Odds._reroll_outcomes[key] = odds
+        return odds
+
+    @staticmethod
+    def reroll_messy_crit_odds(pool, difficulty, hunger=1, include_hunger=True):
+        # DiceRoller.reroll_messy_crit() taken whenever it's offered, i.e. on a messy crit with < 2 red tens and < 4 black tens.
+        key = (V5OddsTable.T_REROLL_MESSY_CRIT, int(pool), int(hunger) if include_hunger else 0, int(difficulty))
+        if key in V5Odds._reroll_outcomes:
+            return V5Odds._reroll_outcomes[key]
+        odds = V5Odds.get_table() and V5Odds.table.lookup(*key)
+        if not odds:
+            odds, difficulty = {outcome: 0.0 for outcome in V5DiceRoll.OUTCOMES}, key[3]
+            black_dice, red_dice = V5Odds.dice_split(key[1], key[2])
+            red_counts = V5Odds.face_counts(red_dice, track_ones=True)
+            for (b_succ, b_tens, _), b_prob in V5Odds.face_counts(black_dice).items():
+                for (r_succ, r_tens, r_ones), r_prob in red_counts.items():
+                    num_successes, crit, red_ten, red_one = V5Odds.settle(b_succ + r_succ, b_tens + r_tens, r_tens > 0, r_ones)
+                    outcome = V5Odds.classify(num_successes - difficulty, crit, red_ten, red_one)
+                    if outcome != V5DiceRoll.RESULT_MESSY_CRIT or r_tens > 1 or b_tens > V5Odds.MAX_REROLLS:
+                        odds[outcome] += b_prob * r_prob
+                        continue
+                    for (n_succ, n_tens, _), n_prob in V5Odds.face_counts(b_tens).items():
+                        state = V5Odds.settle(b_succ - b_tens + n_succ + r_succ, n_tens + r_tens, red_ten, red_one)
+                        odds[V5Odds.classify(state[0] - difficulty, *state[1:])] += b_prob * r_prob * n_prob
+        V5Odds._reroll_outcomes[key] = odds
+        return odds
+
+    @staticmethod
+    def success_odds(odds):
+        return odds[V5DiceRoll.RESULT_WIN] + odds[V5DiceRoll.RESULT_CRIT] + odds[V5DiceRoll.RESULT_MESSY_CRIT]
+
+    @staticmethod
+    def reroll_odds(roll, kept_black, num_rerolls):
+        # Exact outcome odds for an existing roll once num_rerolls black dice are rerolled and kept_black/red dice stay put.
+        red = roll.red_results if roll.included_hunger else []
+        kept = kept_black + red
+        kept_succ = len([dv for dv in kept if dv >= V5DiceRoll.D10_WIN_INC])
+        kept_tens = len([dv for dv in kept if dv >= V5DiceRoll.D10_MAX])
+        red_ten = len([dv for dv in red if dv >= V5DiceRoll.D10_MAX]) > 0
+        red_one = len([dv for dv in red if dv < 2]) > 0
+        odds, expected_margin = {outcome: 0.0 for outcome in V5DiceRoll.OUTCOMES}, 0.0
+        for (succ, tens, _), prob in V5Odds.face_counts(num_rerolls).items():
+            num_successes, crit, _, _ = V5Odds.settle(kept_succ + succ, kept_tens + tens, red_ten, red_one)
+            odds[V5Odds.classify(num_successes - roll.difficulty, crit, red_ten, red_one)] += prob
+            expected_margin += prob * (num_successes - roll.difficulty)
+        current_success = 1.0 if roll.margin >= 0 else 0.0
+        return ObjectWrapper(
+            odds=odds, success_gain=V5Odds.success_odds(odds) - current_success, margin_gain=expected_margin - roll.margin
+        )
+
+    @staticmethod
+    def reroll_advice(roll):  # What each Willpower reroll offered by DiceRoller would do to the current roll.
+        black = roll.black_results
+        fails = [dv for dv in black if dv < V5DiceRoll.D10_WIN_INC]
+        tens = [dv for dv in black if dv >= V5DiceRoll.D10_MAX]
+        num_fails, num_tens = min(V5Odds.MAX_REROLLS, len(fails)), min(V5Odds.MAX_REROLLS, len(tens))
+        kept_for_fails = [dv for dv in black if dv >= V5DiceRoll.D10_WIN_INC] + fails[num_fails:]
+        kept_for_tens = [dv for dv in black if dv < V5DiceRoll.D10_MAX] + tens[num_tens:]
+        return ObjectWrapper(
+            better=V5Odds.reroll_odds(roll, kept_for_fails, num_fails),
+            no_messy=V5Odds.reroll_odds(roll, kept_for_tens, num_tens)
+        )
+
+    @staticmethod
+    def success_distribution(pool, hunger=1, include_hunger=True):  # Index = num_successes.
+        states = V5Odds.roll_states(pool, hunger, include_hunger)
+        distribution = [0.0] * (max(num_successes for num_successes, _, _, _ in states) + 1)
+        for (num_successes, _, _, _), prob in states.items():
+            distribution[num_successes] += prob
+        return distribution
+
+    @staticmethod
+    def contest(pool1, pool2, hunger=1, include_hunger=True):
+        # Mirrors DiceRoller.contest(): the opponent rolls without hunger and their successes become the difficulty.
+        key = (int(pool1), int(pool2), int(hunger) if include_hunger else 0)
+        if key in V5Odds._contests:
+            return V5Odds._contests[key]
+        odds, margins = {outcome: 0.0 for outcome in V5DiceRoll.OUTCOMES}, {}
+        opp_distribution = V5Odds.success_distribution(pool2, 0, include_hunger=False)
+        for (num_successes, crit, red_ten, red_one), prob in V5Odds.roll_states(key[0], key[2]).items():
+            for opp_successes, opp_prob in enumerate(opp_distribution):
+                margin, joint_prob = num_successes - opp_successes, prob * opp_prob
+                odds[V5Odds.classify(margin, crit, red_ten, red_one)] += joint_prob
+                margins[margin] = margins.get(margin, 0.0) + joint_prob
+        V5Odds._contests[key] = odds, dict(sorted(margins.items()))
+        return V5Odds._contests[key]
+
+    @staticmethod
+    def contest_odds(pool1, pool2, hunger=1, include_hunger=True):
+        hunger = int(hunger) if include_hunger else 0
+        odds = V5Odds.get_table() and V5Odds.table.lookup(V5OddsTable.T_CONTEST, int(pool1), int(pool2), hunger)
+        return odds if odds else V5Odds.contest(pool1, pool2, hunger)[0]
+
+    @staticmethod
+    def contest_margins(pool1, pool2, hunger=1, include_hunger=True):
+        return V5Odds.contest(pool1, pool2, hunger, include_hunger)[1]
+
+    @staticmethod
+    def build_contest_table(max_pool=MAX_POOL, max_hunger=Config.HUNGER_MAX):  # Fills the cache for every pool pair.
+        for hunger in range(max_hunger + 1):
+            for pool1 in range(max_pool + 1):
+                for pool2 in range(max_pool + 1):
+                    V5Odds.contest(pool1, pool2, hunger)
+        return V5Odds._contests
+
+
+class V5OddsTable:  # Read-only, zero-copy view of the odds file written by build_odds_table.py.
+    FILE_NAME = "v5_odds.bin"
+    MAGIC = b"V5OD"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBcBBBB6x")  # magic, version, byte order, max pool, max hunger, max difficulty, outcomes
+
+    T_ROLL = "roll"  # [pool][hunger][difficulty][outcome]
+    T_CONTEST = "contest"  # [pool][opposing pool][hunger][outcome]
+    T_REROLL_FAILS = "reroll_fails"  # [pool][hunger][difficulty][outcome]
+    T_REROLL_MESSY_CRIT = "reroll_messy_crit"  # [pool][hunger][difficulty][outcome]
+    TABLES = (T_ROLL, T_CONTEST, T_REROLL_FAILS, T_REROLL_MESSY_CRIT)
+
+    def __init__(self, buffer):
+        magic, version, byteorder, max_pool, max_hunger, max_diff, num_outcomes = V5OddsTable.HEADER.unpack_from(buffer)
+        if magic != V5OddsTable.MAGIC or version != V5OddsTable.VERSION:
+            raise ValueError("Not a version {} odds table.".format(V5OddsTable.VERSION))
+        if byteorder != V5OddsTable.byteorder_tag() or num_outcomes != len(V5DiceRoll.OUTCOMES):
+            raise ValueError("Odds table was built for a different platform or ruleset.")
+        self.buffer = buffer
+        self.max_pool, self.max_hunger, self.max_diff = max_pool, max_hunger, max_diff
+        self.shapes = V5OddsTable.get_shapes(max_pool, max_hunger, max_diff)
+        self.offsets, offset = {}, 0
+        for tname in V5OddsTable.TABLES:
+            self.offsets[tname] = offset
+            offset += V5OddsTable.table_size(self.shapes[tname])
+        self.floats = memoryview(buffer)[V5OddsTable.HEADER.size:].cast('f')
+        if len(self.floats) != offset:
+            raise ValueError("Odds table is {} floats long; expected {}.".format(len(self.floats), offset))
+
+    @staticmethod
+    def byteorder_tag():
+        return b'<' if sys.byteorder == "little" else b'>'
+
+    @staticmethod
+    def get_shapes(max_pool, max_hunger, max_diff):
+        num_outcomes = len(V5DiceRoll.OUTCOMES)
+        return {
+            V5OddsTable.T_ROLL: (max_pool + 1, max_hunger + 1, max_diff + 1, num_outcomes),
+            V5OddsTable.T_CONTEST: (max_pool + 1, max_pool + 1, max_hunger + 1, num_outcomes),
+            V5OddsTable.T_REROLL_FAILS: (max_pool + 1, max_hunger + 1, max_diff + 1, num_outcomes),
+            V5OddsTable.T_REROLL_MESSY_CRIT: (max_pool + 1, max_hunger + 1, max_diff + 1, num_outcomes)
+        }
+
+    @staticmethod
+    def table_size(shape):
+        size = 1
+        for dim in shape:
+            size *= dim
+        return size
+
+    def lookup(self, tname, i, j, k):  # Returns None for anything outside the table, so callers can compute it instead.
+        shape = self.shapes[tname]
+        if not (0 <= i < shape[0] and 0 <= j < shape[1] and 0 <= k < shape[2]):
+            return None
+        start = self.offsets[tname] + ((i * shape[1] + j) * shape[2] + k) * shape[3]
+        return dict(zip(V5DiceRoll.OUTCOMES, self.floats[start:start + shape[3]]))
+
+    @staticmethod
+    def load(file_name=FILE_NAME):
+        try:
+            return V5OddsTable(Utils.map_data_file(file_name))
+        except (FileNotFoundError, ValueError, struct.error) as e:
+            Utils.log("{}: No usable odds table in \"{}\"; odds will be computed as needed.".format(e.__class__, file_name), e)
+            return None
+
+    @staticmethod
+    def build(max_pool=V5Odds.MAX_POOL, max_hunger=Config.HUNGER_MAX, max_diff=V5Odds.MAX_DIFFICULTY):
+        shapes, floats = V5OddsTable.get_shapes(max_pool, max_hunger, max_diff), array('f')
+        V5Odds.table, V5Odds._table_checked = None, True  # Never build from a stale table.
+        odds_funcs = {
+            V5OddsTable.T_ROLL: lambda pool, hunger, diff: V5Odds.outcome_odds(pool, diff, hunger),
+            V5OddsTable.T_CONTEST: lambda pool1, pool2, hunger: V5Odds.contest(pool1, pool2, hunger)[0],
+            V5OddsTable.T_REROLL_FAILS: lambda pool, hunger, diff: V5Odds.reroll_fails_odds(pool, diff, hunger),
+            V5OddsTable.T_REROLL_MESSY_CRIT: lambda pool, hunger, diff: V5Odds.reroll_messy_crit_odds(pool, diff, hunger)
+        }
+        for tname in V5OddsTable.TABLES:
+            shape = shapes[tname]
+            for i in range(shape[0]):
+                for j in range(shape[1]):
+                    for k in range(shape[2]):
+                        odds = odds_funcs[tname](i, j, k)
+                        floats.extend(odds[outcome] for outcome in V5DiceRoll.OUTCOMES)
+        header = V5OddsTable.HEADER.pack(
+            V5OddsTable.MAGIC, V5OddsTable.VERSION, V5OddsTable.byteorder_tag(), max_pool, max_hunger, max_diff, len(V5DiceRoll.OUTCOMES)
+        )
+        return header + floats.tobytes()
@@ -0,0 +1,209 @@
+import argparse
+import builtins
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from os import cpu_count, environ
+
+environ.setdefault("KIVY_NO_ARGS", "1")  # Kivy would otherwise take our command line arguments as its own.
+environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from config import Config
+from core_game import CoreGame
+from game_events import EventLibrary
+from game_interface import RecordingGameInterface, HeadlessPlayer
+from utils import V5DiceRoll
+
+# Plays the story headless down every choice and every distinct dice outcome, spread across a process pool:
+#   python explore_story.py                    from the start of a new game
+#   python explore_story.py --event <eid>      from any indexed event instead
+#   python explore_story.py --json report.json
+# Reports moments never reached, dead ends and exceptions, each with the choices and rolls that led there. Exit code 1 if
+# anything raised.
+
+
+class ExplorerGame(CoreGame):  # Remembers every moment it has, and can start from any event.
+    def __init__(self, gui, start_eid=None):
+        super().__init__(gui)
+        self.start_eid = start_eid
+        self.visited = set()  # (event key, moment index)
+        self.events = {}  # event key -> moment labels, in order
+        self.location = None  # (event key, moment index) of the latest moment
+
+    @staticmethod
+    def event_key(event):  # Standard events get a random eid every time, so they go by their type instead.
+        return event.type if str(event.eid).startswith("gevent_") else event.eid
+
+    def im_having_a_moment(self):
+        event = self.state.current_event
+        if event is not None and 0 <= event.index < len(event.itinerary):
+            key = ExplorerGame.event_key(event)
+            if key not in self.events:
+                self.events[key] = [m.mid if m.mid else "#{}".format(i + 1) for i, m in enumerate(event.itinerary)]
+            self.location = (key, event.index)
+            self.visited.add(self.location)
+        return super().im_having_a_moment()
+
+    def load_standard_event(self, eid):
+        if self.start_eid is None:
+            return super().load_standard_event(eid)
+        self.state.current_event = EventLibrary.load_event(self.start_eid)
+        return self.state.current_event
+
+
+class StoryExplorer:
+    D_CHOICE, D_ROLL = "choice", "roll"
+    R_DECISION, R_DEAD_END, R_EXCEPTION = "decision", "dead_end", "exception"
+
+    @staticmethod
+    def get_options(game, interface):  # Every way the player could answer, or None if there's nothing to decide.
+        if interface.waiting_for == RecordingGameInterface.T_CHOICES:
+            return [(StoryExplorer.D_CHOICE, choice[Config.REF_GOTO_MOMENT]) for choice in interface.choices
+                    if choice.get(Config.REF_CHOICE_ENABLED, True)]
+        elif interface.waiting_for == RecordingGameInterface.T_ROLL:
+            options, targets = [], set()
+            for outcome in V5DiceRoll.OUTCOMES:  # Outcomes that end up at the same moment are one branch.
+                target = CoreGame.get_roll_outcome_mid(game.state.temp_dice_roll_moment, outcome)
+                if target not in targets:
+                    targets.add(target)
+                    options.append((StoryExplorer.D_ROLL, outcome))
+            return options
+        return None
+
+    @staticmethod
+    def run_branch(path, start_eid=None, max_segment=1000, dev_mode=False):  # Runs in a worker process.
+        # A branch is forked by replaying its decisions in a new game. Dice outcomes are forced, so replays are exact;
+        # GameState is a Kivy EventDispatcher, which can't be copied or pickled.
+        Config.DEV_MODE = dev_mode
+        interface = RecordingGameInterface(keep_history=False)
+        game = ExplorerGame(interface, start_eid)
+        player = HeadlessPlayer(game, interface)
+        result, taken, segment_start = {"path": list(path)}, 0, 0
+        real_print = builtins.print
+        builtins.print = lambda *args, **kwargs: None
+        try:
+            game.load_game()
+            player.settle()
+            while True:
+                options = StoryExplorer.get_options(game, interface)
+                if options is not None:
+                    if not options:
+                        result.update(kind=StoryExplorer.R_DEAD_END, reason="no enabled choices")
+                        break
+                    if taken == len(path):
+                        result.update(kind=StoryExplorer.R_DECISION, options=options)
+                        break
+                    (dtype, value), taken, segment_start = path[taken], taken + 1, game.num_moments
+                    if dtype == StoryExplorer.D_CHOICE:
+                        game.current_event_repoint(target_mindex=None, target_mid=value)
+                    else:
+                        game.state.current_roll.outcome = value
+                        game.confirm_roll()
+                elif interface.waiting_for is None and not len(game.state.event_queue):
+                    result.update(kind=StoryExplorer.R_DEAD_END, reason="nothing left to play")
+                    break
+                elif game.num_moments - segment_start > max_segment:
+                    result.update(kind=StoryExplorer.R_DEAD_END, reason="{} moments without a decision".format(max_segment))
+                    break
+                interface.waiting_for = None
+                game.player_input_unblock()
+                player.settle()
+        except Exception as e:
+            result.update(kind=StoryExplorer.R_EXCEPTION, error="{}: {}".format(e.__class__.__name__, e), path=list(path[:taken]))
+        finally:
+            builtins.print = real_print
+        result.update(location=list(game.location) if game.location else None, visited=sorted(game.visited), events=game.events)
+        return result
+
+    @staticmethod
+    def explore(start_eid=None, jobs=None, max_branches=5000, max_segment=1000, dev_mode=False):
+        report = {"branches": 0, "decision_points": 0, "events": {}, "visited": set(), "dead_ends": {}, "exceptions": {}}
+        explored = set()  # (location, option) pairs already handed out, so loops like the haven hub are only taken once
+        with ProcessPoolExecutor(max_workers=max(1, jobs if jobs else cpu_count())) as pool:
+            pending = {pool.submit(StoryExplorer.run_branch, [], start_eid, max_segment, dev_mode)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    StoryExplorer.merge(report, result)
+                    if result["kind"] != StoryExplorer.R_DECISION:
+                        continue
+                    location = tuple(result["location"]) if result["location"] else None
+                    new_options = [option for option in result["options"] if (location, option) not in explored]
+                    if new_options:
+                        report["decision_points"] += 1
+                    for option in new_options:
+                        if report["branches"] + len(pending) >= max_branches:
+                            break
+                        explored.add((location, option))
+                        pending.add(pool.submit(StoryExplorer.run_branch, result["path"] + [option], start_eid, max_segment, dev_mode))
+        return StoryExplorer.summarize(report)
+
+    @staticmethod
+    def merge(report, result):
+        report["branches"] += 1
+        report["events"].update(result["events"])
+        report["visited"].update([tuple(location) for location in result["visited"]])
+        where = StoryExplorer.label(report["events"], result["location"])
+        if result["kind"] == StoryExplorer.R_DEAD_END:
+            report["dead_ends"].setdefault((where, result["reason"]), result["path"])  # First (shortest-ish) path wins.
+        elif result["kind"] == StoryExplorer.R_EXCEPTION:
+            report["exceptions"].setdefault((where, result["error"]), result["path"])
+
+    @staticmethod
+    def label(events, location):
+        if not location:
+            return "<before the first moment>"
+        key, index = location
+        return "{} / {}".format(key, events[key][index] if key in events else "#{}".format(index + 1))
+
+    @staticmethod
+    def format_path(path):
+        return " > ".join(["{}:{}".format(dtype, value) for dtype, value in path]) if path else "<start>"
+
+    @staticmethod
+    def summarize(report):
+        events = {}
+        for key in sorted(report["events"], key=str):
+            labels = report["events"][key]
+            visited = [i for i in range(len(labels)) if (key, i) in report["visited"]]
+            events[key] = {
+                "moments": len(labels),
+                "visited": len(visited),
+                "unvisited": [labels[i] for i in range(len(labels)) if (key, i) not in report["visited"]]
+            }
+        return {
+            "branches": report["branches"],
+            "decision_points": report["decision_points"],
+            "events": events,
+            "dead_ends": [{"where": where, "reason": reason, "path": StoryExplorer.format_path(path)}
+                          for (where, reason), path in sorted(report["dead_ends"].items())],
+            "exceptions": [{"where": where, "error": error, "path": StoryExplorer.format_path(path)}
+                           for (where, error), path in sorted(report["exceptions"].items())]
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Explore every story branch headless and report coverage.")
+    parser.add_argument("--event", default=None, help="start from this eid instead of a new game")
+    parser.add_argument("--jobs", type=int, default=cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument("--max-branches", type=int, default=5000, help="stop handing out new branches after this many")
+    parser.add_argument("--dev-char", action="store_true", help="start with the DEV_MODE test character, skipping character creation")
+    parser.add_argument("--json", default=None, help="also write the full report to this file")
+    args = parser.parse_args()
+    coverage = StoryExplorer.explore(start_eid=args.event, jobs=args.jobs, max_branches=args.max_branches, dev_mode=args.dev_char)
+    for eid, stats in coverage["events"].items():
+        print("{}: {}/{} moments visited{}".format(
+            eid, stats["visited"], stats["moments"], "; never reached: " + ", ".join(stats["unvisited"]) if stats["unvisited"] else ""
+        ))
+    for dead_end in coverage["dead_ends"]:
+        print("Dead end at {} ({}), via {}".format(dead_end["where"], dead_end["reason"], dead_end["path"]))
+    for exception in coverage["exceptions"]:
+        print("Exception at {}: {}, via {}".format(exception["where"], exception["error"], exception["path"]))
+    print("{} branches from {} decision points: {} dead ends, {} exceptions.".format(
+        coverage["branches"], coverage["decision_points"], len(coverage["dead_ends"]), len(coverage["exceptions"])
+    ))
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(coverage, report_file, indent=2)
+    sys.exit(1 if coverage["exceptions"] else 0)
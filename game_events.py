@@ -1,7 +1,16 @@
+import ast
+import hashlib
+import json
+import operator
+import pickle
+import re
+import struct
+import zlib
+from os import listdir, path, makedirs, replace, stat
 from typing import List
 
 from config import Config
-from utils import Utils
+from utils import Utils, ObjectWrapper
 
 
 class Moment:  # A single event within an Event, consisting of a type and a unique mid for reference. Normally handled sequentially.
@@ -10,6 +19,7 @@ class Moment:  # A single event within an Event, consisting of a type and a uniq
     M_STATE_CHANGE = "state_change"
     M_DICE_ROLL = "roll"
     M_JUMP_2_EVENT = "jump_to_event"
+    _mtypes = {}  # moment.type as written -> validated type, so each spelling is only checked once.
 
     def __init__(self, mid=None):
         self.type = None
@@ -31,15 +41,105 @@ class Moment:  # A single event within an Event, consisting of a type and a uniq
             return Moment.M_DICE_ROLL
         elif mstr == Moment.M_STATE_CHANGE or mstr[:1] == Moment.M_STATE_CHANGE[:1]:
             return Moment.M_STATE_CHANGE
-        elif mstr is not None and mstr is "":
+        elif mstr == Moment.M_JUMP_2_EVENT or mstr[:1] == Moment.M_JUMP_2_EVENT[:1]:
+            return Moment.M_JUMP_2_EVENT
+        elif mstr == "":
             return Moment.M_TEXT_BLURB
         else:
             return None
 
+    @staticmethod
+    def get_mtype(mtype):
+        if mtype not in Moment._mtypes:
+            Moment._mtypes[mtype] = Moment.validate_mtype(str(mtype).lower())
+        return Moment._mtypes[mtype]
+
 
 Script = List[Moment]
 
 
+class Itinerary(list):  # An event's moments, plus a mid -> index map so jumping to a mid is a dict lookup instead of a scan.
+    def __init__(self, moments=()):
+        super().__init__()
+        self.mid_index = {}
+        self.extend(moments)
+
+    def __reduce__(self):  # Pickles (and copies) as a plain list of moments; the map is rebuilt on load.
+        return Itinerary, (list(self),)
+
+    @staticmethod
+    def duplicate_mid_error(mid, first, second):
+        return ValueError("Duplicate mid \"{}\" at moments {} and {}; moment ids must be unique within an event.".format(mid, first, second))
+
+    @staticmethod
+    def build_mid_index(moments):
+        mid_index = {}
+        for i, moment in enumerate(moments):
+            if moment.mid is not None:
+                if moment.mid in mid_index:
+                    raise Itinerary.duplicate_mid_error(moment.mid, mid_index[moment.mid], i)
+                mid_index[moment.mid] = i
+        return mid_index
+
+    def find(self, mid):
+        return self.mid_index.get(mid)
+
+    def append(self, moment):
+        if moment.mid is not None:
+            if moment.mid in self.mid_index:
+                raise Itinerary.duplicate_mid_error(moment.mid, self.mid_index[moment.mid], len(self))
+            self.mid_index[moment.mid] = len(self)
+        super().append(moment)
+
+    def extend(self, moments):
+        for moment in moments:
+            self.append(moment)
+
+    def __iadd__(self, moments):
+        self.extend(moments)
+        return self
+
+    def replace_all(self, moments):  # Anything other than an append shifts indices, so the map is rebuilt (and checked) first.
+        mid_index = Itinerary.build_mid_index(moments)
+        super().__setitem__(slice(None), moments)
+        self.mid_index = mid_index
+
+    def insert(self, index, moment):
+        moments = list(self)
+        moments.insert(index, moment)
+        self.replace_all(moments)
+
+    def __setitem__(self, key, value):
+        moments = list(self)
+        moments[key] = value
+        self.replace_all(moments)
+
+    def __delitem__(self, key):
+        moments = list(self)
+        del moments[key]
+        self.replace_all(moments)
+
+    def pop(self, index=-1):
+        moment = self[index]
+        del self[index]
+        return moment
+
+    def remove(self, moment):
+        del self[self.index(moment)]
+
+    def clear(self):
+        super().clear()
+        self.mid_index = {}
+
+    def sort(self, *args, **kwargs):
+        moments = list(self)
+        moments.sort(*args, **kwargs)
+        self.replace_all(moments)
+
+    def reverse(self):
+        self.replace_all(list(reversed(self)))
+
+
 class TextBlurb(Moment):  # A blurb is just text that gets read into the GUI.
     def __init__(self, mid=None, text="<Insert text here>", goto=None):
         super().__init__(mid=mid)
@@ -98,9 +198,10 @@ class GameEvent:  # A packaged bundle of moments that constitute a scene. Buildi
     EVT_HUNT_RANDOM = "hunt-random"
     EVT_SORTIE_GENERAL = "defense-random"
     EVT_DAYBREAK = "next-sunrise"
+    STANDARD_EIDS = (EVT_HUB_MAIN, EVT_HUNT_RANDOM, EVT_SORTIE_GENERAL, EVT_DAYBREAK)
 
     def __init__(self, etype, eid=None, itinerary: Script = ()):
-        self._itinerary = list(itinerary)
+        self._itinerary = Itinerary(itinerary)
         self.type = etype
         self.eid = eid
         if not self.eid:
@@ -125,7 +226,7 @@ class GameEvent:  # A packaged bundle of moments that constitute a scene. Buildi
 
     @itinerary.setter
     def itinerary(self, new_itin):
-        self._itinerary = new_itin
+        self._itinerary = new_itin if isinstance(new_itin, Itinerary) else Itinerary(new_itin)
 
     def next_moment(self):
         if 0 > self.index >= len(self.itinerary):
@@ -138,144 +239,916 @@ class GameEvent:  # A packaged bundle of moments that constitute a scene. Buildi
         elif mid is None:
             self.index = mindex
         else:
-            old_index = self.index
-            indexed_moment = [(index, elem) for index, elem in enumerate(self.itinerary) if elem.mid == mid]
-            if len(indexed_moment) < 1:
+            old_index, new_index = self.index, self.itinerary.find(mid)  # NOTE: Moment ids must be unique within an event.
+            if new_index is None:
                 raise ValueError("Failed mid lookup in repoint(); no match for mid=\"{}\" (old index was {})!".format(mid, old_index))
-            try:
-                self.index = indexed_moment[0][0]  # NOTE: Moment ids must be unique within an event.
-                Utils.log("event.index changed via mid: {} --> {}".format(old_index, self.index))
-            except Exception as e:
-                Utils.log("Unexplained {} occurred during mid lookup in repoint()".format(e.__class__), e)
+            self.index = new_index
+            Utils.log("event.index changed via mid: {} --> {}".format(old_index, self.index))
 
     @staticmethod
     def build_from_txt(filename, eid):
-        event_txt_lines = Utils.read_text_from_file(filename, mode='r')
+        return ScriptParser(Utils.read_text_from_file(filename, mode='r'), source=filename).parse(eid)
+
+
+class ScriptParser:  # Single pass over a ">|" event script: every line is lexed once, and errors name the line they're on.
+    TAG_PREFIX = ">|"
+    T_BLANK, T_TEXT, T_TAG = 0, 1, 2
+    EXPR_KEY = "{}"
+    HEAD_PATTERN = re.compile(r'(\w+)(?:="([^"]*)")?$')
+    FIELD_PATTERN = re.compile(r'(\w+)=(?:"(.*)"|\{(.*)\})$', re.DOTALL)
+    EXPR_PATTERN = re.compile(r'\{(.*)\}$', re.DOTALL)
+    ROLL_TARGETS = {
+        Config.REF_WIN: "mid_win", Config.REF_FAIL: "mid_lose", Config.REF_CRIT: "mid_crit",
+        Config.REF_MESSYCRIT: "mid_messycrit", Config.REF_BEASTFAIL: "mid_beastfail"
+    }
+
+    def __init__(self, lines, source="<script>", first_line=1):
+        self.lines = lines
+        self.source = source
+        self.first_line = first_line  # Lets a slice of a script (see LazyScript) report its real line numbers.
+        self.line_num = 0
+
+    def error(self, message, line_num=None):
+        return ValueError("{}, line {}: {}".format(self.source, line_num if line_num else self.line_num, message))
+
+    def lex(self):  # One token per line: (kind, line number, tag name, tag value, text without the newline).
+        tokens = []
+        for line_num, line in enumerate(self.lines, start=self.first_line):
+            text = line.rstrip("\r\n")
+            if not text.strip():
+                tokens.append((ScriptParser.T_BLANK, line_num, None, None, text))
+            elif text.startswith(ScriptParser.TAG_PREFIX):
+                head = ScriptParser.HEAD_PATTERN.match(text.split('|', 2)[1].strip())
+                if not head:
+                    raise self.error("Malformed tag \"{}\".".format(text.split('|', 2)[1]), line_num)
+                tokens.append((ScriptParser.T_TAG, line_num, head.group(1), head.group(2) if head.group(2) else None, text))
+            else:
+                tokens.append((ScriptParser.T_TEXT, line_num, None, None, text))
+        return tokens
+
+    @staticmethod
+    def read_field(field):  # Returns (key, value): key="value", key={expr}, a bare {expr}, or plain text with no key.
+        stripped = field.strip()
+        match = ScriptParser.FIELD_PATTERN.match(stripped)
+        if match:
+            return match.group(1), match.group(2) if match.group(2) is not None else match.group(3)
+        match = ScriptParser.EXPR_PATTERN.match(stripped)
+        if match:
+            return ScriptParser.EXPR_KEY, match.group(1)
+        return None, field
+
+    @staticmethod
+    def tag_fields(text):  # Everything after the ">|tag" head.
+        return text.split('|')[2:]
+
+    @staticmethod
+    def block_end(tokens, index):  # Blurbs and rolls run until the next blank line or tag.
+        index += 1
+        while index < len(tokens) and tokens[index][0] == ScriptParser.T_TEXT:
+            index += 1
+        return index
+
+    def parse(self, eid):
+        tokens = self.lex()
         evt = GameEvent(etype="event_from_text", eid=eid)
-        current_moment, i, goto_tag = None, 0, "goto=\""
-        c_enabled_tag, c_shown_tag = "enabled={", "shown={"
-        while i < len(event_txt_lines):
-            line, line_tokens, tag, goto = event_txt_lines[i], None, None, None
-            special_token = line.startswith(">|")
-            if special_token:
-                line_tokens = line.split('|')
-                tag = line_tokens[1]
-            if current_moment is None and ((not special_token) or "label" in line_tokens[1]):  # TextBlurb
-                b_text, i_jump = GameEvent.compile_single_blurb(event_txt_lines, i)
-                tb_mid = tag.split('"')[1] if tag else None
-                line_tokens = b_text.split('|')
-                for btt in line_tokens:
-                    if goto_tag in btt:
-                        goto = btt.split('"')[1]
-                    elif "label" in btt:
-                        tb_mid = btt.split('"')[1]
-                    else:
-                        b_text = btt
-                if goto:
-                    print("FFFF")
-                # if b_text.find(goto_tag) > -1:
-                #     line_tokens = b_text.split(goto_tag)
-                #     b_text, goto = line_tokens[0], line_tokens[1].strip("\"\n")
-                #     goto = goto.split('"')[0]
-                if b_text:
-                    b_text_tokens = b_text.split('|')
-                    tokens_dropped = 0
-                    for ibt in range(len(b_text_tokens) - 1, -1, -1):
-                        bt = b_text_tokens[ibt]
-                        if not bt or bt == ">":
-                            b_text_tokens.remove(bt)
-                            tokens_dropped += 1
-                    # if len(b_text_tokens) > 1:
-                    b_text = b_text_tokens[-1]
-                    evt.itinerary.append(TextBlurb(text=b_text.strip('\n'), goto=goto, mid=tb_mid))
-                i = i_jump
+        for start, end in self.split_moments(tokens):
+            self.add_moment(evt, self.read_moment(tokens[start:end]), tokens[start][1])
+        return evt
+
+    def split_moments(self, tokens):  # Yields each moment's (start, end) token range. Only needs token kinds and tags.
+        if not tokens or tokens[0][2] != "event_start":
+            raise self.error("There should be an event tag in the first line.", self.first_line)
+        i = 1
+        while i < len(tokens):
+            kind, self.line_num, tag = tokens[i][:3]
+            if kind == ScriptParser.T_BLANK:
+                i += 1
+                continue
+            elif kind == ScriptParser.T_TEXT or tag == "label" or tag == "roll":
+                end = ScriptParser.block_end(tokens, i)
+            elif tag == "choice_start":
+                end = self.choice_end(tokens, i)
+            elif tag == "statechange":
+                end = i + 1
+            elif tag == "event_end":
+                return
+            elif tag == "choice_end":
+                raise self.error("Found >|choice_end without a matching >|choice_start.")
             else:
-                if i == 0 and "event_start" not in tag:
-                    raise ValueError("There should be an event tag in the first line.")
-                if Utils.is_iterable(tag) and "choice_start" in tag:  # start of UserChoice
-                    uc_mid = tag.split('"')[1]
-                    current_moment = UserChoice(mid=uc_mid, text=line_tokens[2].strip('\n'))
-                elif Utils.is_iterable(tag) and "choice_end" in tag and isinstance(current_moment, UserChoice):  # end of UserChoice
-                    evt.itinerary.append(current_moment)
-                    current_moment = None
-                elif isinstance(current_moment, UserChoice):  # UserChoice options
-                    if not line.strip("\n"):
-                        i += 1
-                        continue
-                    line_tokens, cl_text, choice_opt = line.split('|'), "", {}
-                    for ltoken in line_tokens:
-                        if c_enabled_tag in ltoken:
-                            choice_opt[Config.REF_CHOICE_ENABLED] = Utils.get_excerpt(ltoken, "{", "}")
-                        elif c_shown_tag in ltoken:
-                            choice_opt[Config.REF_CHOICE_SHOWN] = Utils.get_excerpt(ltoken, "{", "}")
-                        elif goto_tag in ltoken:
-                            goto = choice_opt[Config.REF_GOTO_MOMENT] = ltoken.split(goto_tag)[1].strip("\"\n")
-                        else:
-                            cl_text = choice_opt[Config.REF_CHOICE_LABEL] = ltoken
-                    # cl_text, goto = line_tokens[0], line_tokens[1].split(goto_tag)[1].strip("\"\n")
-                    if not goto:
-                        raise ValueError("Every choice option needs a goto mid link.")
-                    if cl_text and cl_text != "\n":
-                        current_moment.choices.append(choice_opt)
-                elif Utils.is_iterable(tag) and "roll" in tag:
-                    r_text, i_jump = GameEvent.compile_single_blurb(event_txt_lines, i)
-                    line_tokens, dice_roll = r_text.split('|'), DiceRoll("wits+inspection")
-                    for ltoken in line_tokens:
-                        if "{" in ltoken and "}" in ltoken:
-                            contest = Utils.get_excerpt(ltoken, "{", "}").split('#')
-                            dice_roll.pool, challenge = contest[0], contest[1]
-                            if "diff" in challenge:
-                                dice_roll.difficulty = challenge.split("diff")[1]
-                            elif "pool" in challenge:
-                                dice_roll.opp_pool = challenge.split("pool")[1]
-                            else:
-                                raise ValueError("An enemy pool or base difficulty is required for a DiceRoll object!")
-                        elif "roll=\"" in ltoken:
-                            dice_roll.mid = ltoken.split('"')[1]
-                        elif (Config.REF_WIN + "=\"") in ltoken:
-                            dice_roll.mid_win = ltoken.split('"')[1]
-                        elif (Config.REF_FAIL + "=\"") in ltoken:
-                            dice_roll.mid_lose = ltoken.split('"')[1]
-                        elif (Config.REF_CRIT + "=\"") in ltoken:
-                            dice_roll.mid_crit = ltoken.split('"')[1]
-                        elif (Config.REF_MESSYCRIT + "=\"") in ltoken:
-                            dice_roll.mid_messycrit = ltoken.split('"')[1]
-                        elif (Config.REF_BEASTFAIL + "=\"") in ltoken:
-                            dice_roll.mid_beastfail = ltoken.split('"')[1]
-                    evt.itinerary.append(dice_roll)
-                    i = i_jump
-                elif Utils.is_iterable(tag) and "statechange" in tag:  # StateChange should always be able to fit on one line.
-                    sc_text, sc_expr, goto = None, None, None
-                    for ltoken in line_tokens:
-                        if "text=\"" in ltoken:
-                            sc_text = ltoken.split('"')[1]
-                        elif "{" in ltoken and "}" in ltoken:
-                            sc_expr = ltoken.split('{')[1].split('}')[0]
-                        elif goto_tag in ltoken:
-                            goto = ltoken.split(goto_tag)[1].strip("\"\n")
-                    mid_in_tag = tag.split('"')
-                    sc = StateChange(mid=mid_in_tag[1] if len(mid_in_tag) > 1 else mid_in_tag[0], goto=goto, expr=sc_expr, text=sc_text)
-                    evt.itinerary.append(sc)
-                elif "event_end" in tag:
-                    break
-                elif i > 0:
-                    raise NotImplemented("We haven't implemented anything past this!")
-            i += 1
+                raise self.error("Unknown tag \"{}\".".format(tag))
+            yield i, end
+            i = end
+        raise self.error("Missing >|event_end tag.", tokens[-1][1])
+
+    def choice_end(self, tokens, index):
+        start_line = tokens[index][1]
+        for i in range(index + 1, len(tokens)):
+            if tokens[i][0] == ScriptParser.T_TAG:
+                if tokens[i][2] != "choice_end":
+                    raise self.error("Expected a choice option or >|choice_end, found \"{}\".".format(tokens[i][2]), tokens[i][1])
+                return i + 1
+        raise self.error("Choice \"{}\" is missing its >|choice_end tag.".format(tokens[index][3]), start_line)
+
+    def read_moment(self, block):
+        kind, self.line_num, tag, tag_value, text = block[0]
+        if kind == ScriptParser.T_TEXT or tag == "label":
+            return self.read_blurb(block)
+        elif tag == "choice_start":
+            return self.read_choice(block)
+        elif tag == "roll":
+            return self.read_roll(block)
+        return self.read_state_change(tag_value, text)
+
+    def add_moment(self, evt, moment, line_num=None):
+        if moment.mid is not None and evt.itinerary.find(moment.mid) is not None:
+            raise self.error("Duplicate mid \"{}\"; moment ids must be unique within an event.".format(moment.mid), line_num)
+        evt.itinerary.append(moment)
+
+    def check_expr(self, expr):  # Compiles (and caches) an expression now, so a typo fails at load time instead of mid-game.
+        try:
+            EventParser.compile_expr(expr)
+        except ValueError as e:
+            raise self.error(str(e))
+        return expr
+
+    def check_template(self, text):
+        try:
+            EventParser.compile_template(text)
+        except ValueError as e:
+            raise self.error(str(e))
+        return text
+
+    def read_blurb(self, block):
+        text, goto, mid = None, None, block[0][3]
+        # NOTE: Lines within a blurb are kept apart by an empty line, which is how multi-line blurbs have always looked.
+        fields = "\n\n".join([token[4] for token in block]).split('|')
+        for field in (fields[2:] if block[0][0] == ScriptParser.T_TAG else fields):
+            key, value = ScriptParser.read_field(field)
+            if key == Config.REF_GOTO_MOMENT:
+                goto = value
+            elif key == "label":
+                mid = value
+            elif key is None:
+                if field.strip():
+                    text = field.strip('\n')
+            else:
+                raise self.error("Text blurbs don't take a \"{}\" field.".format(key))
+        if not text:
+            raise self.error("Text blurb has no text.")
+        self.check_template(text)
+        return TextBlurb(text=text, goto=goto, mid=mid)
+
+    def read_choice(self, block):  # From >|choice_start through >|choice_end.
+        start_line, mid, prompt_fields = self.line_num, block[0][3], ScriptParser.tag_fields(block[0][4])
+        if not mid:
+            raise self.error("A choice needs a mid, e.g. >|choice_start=\"my_choice\".")
+        choice = UserChoice(mid=mid, text=prompt_fields[0] if prompt_fields else "")
+        for kind, self.line_num, tag, tag_value, text in block[1:-1]:
+            if kind == ScriptParser.T_TEXT:
+                choice.choices.append(self.read_choice_option(text))
+        if not choice.choices:
+            raise self.error("Choice \"{}\" has no options.".format(mid), start_line)
+        return choice
+
+    def read_choice_option(self, text):
+        option = {}
+        for field in text.split('|'):
+            key, value = ScriptParser.read_field(field)
+            if key == Config.REF_GOTO_MOMENT:
+                option[Config.REF_GOTO_MOMENT] = value
+            elif key == "enabled":
+                option[Config.REF_CHOICE_ENABLED] = self.check_expr(value)
+            elif key == "shown":
+                option[Config.REF_CHOICE_SHOWN] = self.check_expr(value)
+            elif key is None:
+                option[Config.REF_CHOICE_LABEL] = field
+            else:
+                raise self.error("Choice options don't take a \"{}\" field.".format(key))
+        if Config.REF_GOTO_MOMENT not in option:
+            raise self.error("Every choice option needs a goto mid link.")
+        if not option.get(Config.REF_CHOICE_LABEL, "").strip():
+            raise self.error("Choice option has no label.")
+        return option
+
+    def read_roll(self, block):
+        dice_roll = DiceRoll("wits+inspection", mid=block[0][3])
+        for field in ScriptParser.tag_fields("\n\n".join([token[4] for token in block])):
+            key, value = ScriptParser.read_field(field)
+            if key == ScriptParser.EXPR_KEY:
+                contest = value.split('#')
+                if len(contest) != 2:
+                    raise self.error("Dice pools look like {pool#diff3} or {pool#pool3}, not {" + value + "}.")
+                dice_roll.pool, challenge = contest[0], contest[1]
+                if challenge.startswith("diff"):
+                    dice_roll.difficulty = self.read_int(challenge[4:])
+                elif challenge.startswith("pool"):
+                    dice_roll.opp_pool = self.read_int(challenge[4:])
+                else:
+                    raise self.error("An enemy pool or base difficulty is required for a DiceRoll object!")
+            elif key in ScriptParser.ROLL_TARGETS:
+                setattr(dice_roll, ScriptParser.ROLL_TARGETS[key], value)
+            elif key is not None or field.strip():
+                raise self.error("Dice rolls don't take a \"{}\" field.".format(key if key else field.strip()))
+        return dice_roll
+
+    def read_state_change(self, mid, text):  # StateChange should always be able to fit on one line.
+        sc_text, sc_expr, goto = None, None, None
+        for field in ScriptParser.tag_fields(text):
+            key, value = ScriptParser.read_field(field)
+            if key == Config.REF_TEXT:
+                sc_text = value
+            elif key == ScriptParser.EXPR_KEY:
+                sc_expr = self.check_expr(value)
+            elif key == Config.REF_GOTO_MOMENT:
+                goto = value
+            elif key is not None:
+                raise self.error("State changes don't take a \"{}\" field.".format(key))
+            elif field.strip():
+                Utils.log("{}, line {}: Ignoring untagged state change text (use text=\"...\").".format(self.source, self.line_num))
+        if sc_expr is None:
+            raise self.error("State changes need an {expression}.")
+        return StateChange(mid=mid, goto=goto, expr=sc_expr, text=sc_text)
+
+    def read_int(self, value):
+        if not Utils.has_int(value):
+            raise self.error("\"{}\" should be a whole number.".format(value))
+        return int(value)
+
+
+class JsonEventLoader:  # Builds events from a JSON pack like json/test_events.json, streaming one event at a time.
+    @staticmethod
+    def stream_events(file_name):
+        for i, event_data in enumerate(Utils.stream_json_array(file_name)):
+            yield JsonEventLoader.build_event(event_data, "{}, event #{}".format(file_name, i + 1))
+
+    @staticmethod
+    def load_event(file_name, eid):
+        for i, event_data in enumerate(Utils.stream_json_array(file_name)):
+            if isinstance(event_data, dict) and event_data.get(Config.REF_EID) == eid:  # Only the match gets built.
+                return JsonEventLoader.build_event(event_data, "{}, event #{}".format(file_name, i + 1))
+        raise ValueError("No event with eid \"{}\" in {}.".format(eid, file_name))
+
+    @staticmethod
+    def build_event(event_data, source="<json>"):
+        if not isinstance(event_data, dict) or not isinstance(event_data.get(Config.REF_MOMENTS), list):
+            raise ValueError("{}: Events need an eid, a type, and a list of moments.".format(source))
+        evt = GameEvent(etype=event_data.get(Config.REF_TYPE) or "event_from_json", eid=event_data.get(Config.REF_EID))
+        for i, moment_data in enumerate(event_data[Config.REF_MOMENTS]):
+            try:
+                moment = JsonEventLoader.build_moment(moment_data)
+                if moment:
+                    evt.itinerary.append(moment)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise ValueError("{}, moment #{}: {}".format(source, i + 1, e))
+        return evt
+
+    @staticmethod
+    def build_moment(data):  # Returns None for blank placeholder rows.
+        mtype = Moment.validate_mtype(str(data.get(Config.REF_TYPE, "")).lower())
+        mid, text, goto = data.get(Config.REF_MID) or None, data.get(Config.REF_TEXT), data.get(Config.REF_GOTO_MOMENT)
+        if mtype is None:
+            raise ValueError("Unknown moment type \"{}\".".format(data.get(Config.REF_TYPE)))
+        elif mtype == Moment.M_TEXT_BLURB:
+            if not text:
+                if mid is None and not goto:
+                    return None
+                raise ValueError("Text blurb has no text.")
+            EventParser.compile_template(text)
+            return TextBlurb(mid=mid, text=text, goto=goto)
+        elif mtype == Moment.M_USER_CHOICE:
+            if not mid:
+                raise ValueError("A choice needs a mid.")
+            choices = [JsonEventLoader.build_choice_option(option) for option in data[Config.REF_CHOICES]]
+            if not choices:
+                raise ValueError("Choice \"{}\" has no options.".format(mid))
+            return UserChoice(mid=mid, text=text or "", choices=choices)
+        elif mtype == Moment.M_DICE_ROLL:
+            dice_roll = DiceRoll(data["pool"], mid=mid, difficulty=int(data.get("difficulty", 3)))
+            dice_roll.opp_pool = int(data["opp_pool"]) if data.get("opp_pool") is not None else None
+            for key, attr in ScriptParser.ROLL_TARGETS.items():
+                setattr(dice_roll, attr, data.get(key))
+            return dice_roll
+        elif mtype == Moment.M_STATE_CHANGE:
+            expr = data.get(Config.REF_STATE_CHANGE_EXPR)
+            if not expr:
+                raise ValueError("State changes need an \"{}\" expression.".format(Config.REF_STATE_CHANGE_EXPR))
+            EventParser.compile_expr(expr)
+            return StateChange(mid=mid, goto=goto, expr=expr, text=text)
+        return EventJump(mid=mid, destination_eid=data["destination_eid"], text=text)
+
+    @staticmethod
+    def build_choice_option(option):
+        if not option.get(Config.REF_GOTO_MOMENT):
+            raise ValueError("Every choice option needs a goto mid link.")
+        label = option.get(Config.REF_CHOICE_LABEL)
+        if isinstance(label, dict) and Config.REF_EVAL_TAG in label:
+            EventParser.compile_expr(label[Config.REF_EVAL_TAG])
+        elif not isinstance(label, str) or not label.strip():
+            raise ValueError("Choice labels should be either strings or specific dictionaries.")
+        for key in (Config.REF_CHOICE_ENABLED, Config.REF_CHOICE_SHOWN):
+            if option.get(key):
+                EventParser.compile_expr(option[key])
+        return dict(option)
+
+
+class LazyScript:  # Memory-mapped ">|" script, indexed by the byte offsets of its moments. Moments are kept only on demand.
+    LINE_PATTERN = re.compile(  # One match per tag line or blank line, or per run of text lines.
+        rb'>\|[ \t]*(?P<tag>\w+)(?:="(?P<value>[^"]*)")?[ \t]*(?:\|[^\n]*)?\r?(?:\n|\Z)'
+        rb'|>\|(?P<bad>[^\n]*)(?:\n|\Z)'
+        rb'|(?P<text>(?:(?!>\|)[^\n]*\S[^\n]*(?:\n|\Z))+)'
+        rb'|[^\S\n]*(?:\n|\Z)'
+    )
+
+    def __init__(self, filename):
+        self.source = filename
+        self.data = Utils.map_text_file(filename)
+        self.spans = []  # (start offset, end offset, first line number) for each moment
+        self.mid_index = {}
+        self.build_index()
+
+    def __len__(self):
+        return len(self.spans)
+
+    def lex_offsets(self):  # Like ScriptParser.lex(), but with (start, end) byte offsets for text, and runs of text lines merged.
+        tokens, data, size, line_num = [], self.data, len(self.data), 1
+        for match in LazyScript.LINE_PATTERN.finditer(data):
+            if match.start() >= size:
+                break
+            span = match.span()
+            if match.group("tag") is not None:
+                tokens.append((ScriptParser.T_TAG, line_num, match.group("tag").decode('utf-8'),
+                               match.group("value").decode('utf-8') if match.group("value") else None, span))
+            elif match.group("bad") is not None:
+                bad_head = match.group("bad").split(b'|', 1)[0].decode('utf-8').strip()
+                raise ScriptParser([], self.source).error("Malformed tag \"{}\".".format(bad_head), line_num)
+            elif match.group("text") is not None:
+                tokens.append((ScriptParser.T_TEXT, line_num, None, None, span))
+                line_num += match.group("text").count(b"\n") - 1
+            else:
+                tokens.append((ScriptParser.T_BLANK, line_num, None, None, span))
+            line_num += 1
+        return tokens
+
+    def build_index(self):  # Parses every moment once, for the same load-time checks as build_from_txt(), then drops it.
+        tokens, parser = self.lex_offsets(), ScriptParser([], self.source)
+        for start, end in parser.split_moments(tokens):
+            first = tokens[start]
+            self.spans.append((first[4][0], tokens[end - 1][4][1], first[1]))
+            mid = self.materialize(len(self.spans) - 1).mid
+            if mid is not None:
+                if mid in self.mid_index:
+                    raise parser.error("Duplicate mid \"{}\"; moment ids must be unique within an event.".format(mid), first[1])
+                self.mid_index[mid] = len(self.spans) - 1
+
+    def materialize(self, index):
+        start, end, line_num = self.spans[index]
+        parser = ScriptParser(self.data[start:end].decode('utf-8').splitlines(True), self.source, first_line=line_num)
+        return parser.read_moment(parser.lex())
+
+    def load_event(self, eid):
+        evt = GameEvent(etype="event_from_text", eid=eid)
+        evt.itinerary = LazyItinerary(self)
+        return evt
+
+
+class LazyItinerary(Itinerary):  # Starts out as placeholders; each moment is parsed the first time anything reads it.
+    def __init__(self, script):
+        super().__init__()
+        self.script = script
+        list.extend(self, [None] * len(script))
+        self.mid_index = dict(script.mid_index)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        moment = list.__getitem__(self, key)
+        if moment is None:
+            moment = self.script.materialize(key % len(self))
+            list.__setitem__(self, key, moment)
+        return moment
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def num_materialized(self):
+        return len(self) - list.count(self, None)
+
+
+class EventCache:  # Text events are parsed once per file version; every load gets its own copy of the cached prototype.
+    FORMAT_VERSION = 2  # Bump this whenever build_from_txt() changes what it produces, so stale cache files are skipped.
+    FILE_EXT = ".evc"
+    _prototypes = {}  # file name -> (content hash, pickled itinerary)
+    _file_stats = {}  # file path -> ((mtime, size), content hash), so an unchanged file isn't even re-read.
+    _lazy_scripts = {}  # file name -> (content hash, LazyScript)
+    LAZY_MIN_BYTES = 256 * 1024  # Scripts this big are indexed and parsed on demand instead of compiled up front.
+
+    @staticmethod
+    def load_txt(filename, eid):
+        pack = ContentPack.get()
+        if pack is not None and pack.is_current(Config.PATH_TEXT_EVENTS, filename):
+            return pack.load_source(Config.PATH_TEXT_EVENTS, filename, eid)  # Already parsed by build_content_pack.py.
+        digest = EventCache.get_digest(filename)
+        if EventCache.get_file_size(filename) >= EventCache.LAZY_MIN_BYTES:
+            lazy_script = EventCache._lazy_scripts.get(filename)
+            if lazy_script is None or lazy_script[0] != digest:
+                lazy_script = EventCache._lazy_scripts[filename] = (digest, LazyScript(filename))
+            return lazy_script[1].load_event(eid)  # Shares the index, but every event parses its own moments.
+        prototype = EventCache._prototypes.get(filename)
+        if prototype is None or prototype[0] != digest:
+            blob = EventCache.read_compiled(digest)
+            if blob is None:
+                itinerary = GameEvent.build_from_txt(filename, eid).itinerary
+                blob = pickle.dumps(itinerary, protocol=pickle.HIGHEST_PROTOCOL)
+                EventCache.write_compiled(digest, blob)
+            prototype = EventCache._prototypes[filename] = (digest, blob)
+        evt = GameEvent(etype="event_from_text", eid=eid)
+        evt.itinerary = pickle.loads(prototype[1])  # NOTE: Moments get modified during play, so they're never shared.
         return evt
 
     @staticmethod
-    def compile_single_blurb(lines, index):
-        blurb_text, end_i = "", index
-        for i in range(index, len(lines) - 1):
-            line = lines[i]
-            if line == "\n" or not line:
-                end_i = i
+    def get_digest(filename, folder=None):
+        file_path = path.normpath((folder if folder else Config.PATH_TEXT_EVENTS) + '/' + filename)
+        file_stat = stat(file_path)
+        stat_key = (file_stat.st_mtime_ns, file_stat.st_size)
+        known = EventCache._file_stats.get(file_path)
+        if known and known[0] == stat_key:
+            return known[1]
+        hasher = hashlib.sha1()
+        with open(file_path, 'rb') as script_file:
+            for chunk in iter(lambda: script_file.read(1 << 16), b""):
+                hasher.update(chunk)
+        hasher.update("v{}".format(EventCache.FORMAT_VERSION).encode())
+        EventCache._file_stats[file_path] = (stat_key, hasher.hexdigest())
+        return EventCache._file_stats[file_path][1]
+
+    @staticmethod
+    def get_file_size(filename, folder=None):  # As of the last get_digest() call.
+        return EventCache._file_stats[path.normpath((folder if folder else Config.PATH_TEXT_EVENTS) + '/' + filename)][0][1]
+
+    @staticmethod
+    def get_cache_path(digest):
+        return path.normpath(Config.PATH_CACHE + '/' + digest + EventCache.FILE_EXT)
+
+    @staticmethod
+    def read_compiled(digest):
+        try:
+            with open(EventCache.get_cache_path(digest), 'rb') as cache_file:
+                blob = cache_file.read()
+            pickle.loads(blob)  # Make sure it's usable before we hand out copies of it.
+            return blob
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            Utils.log("{}: Ignoring unreadable compiled event \"{}\".".format(e.__class__, digest), e)
+            return None
+
+    @staticmethod
+    def write_compiled(digest, blob):
+        cache_path = EventCache.get_cache_path(digest)
+        try:
+            makedirs(Config.PATH_CACHE, exist_ok=True)
+            with open(cache_path + ".tmp", 'wb') as cache_file:
+                cache_file.write(blob)
+            replace(cache_path + ".tmp", cache_path)  # Never leaves a half-written file behind.
+        except OSError as e:
+            Utils.log("{}: Couldn't write compiled event \"{}\"; it'll be parsed again next run.".format(e.__class__, digest), e)
+
+    @staticmethod
+    def clear():
+        EventCache._prototypes.clear()
+        EventCache._file_stats.clear()
+        EventCache._lazy_scripts.clear()
+
+
+class EventExpr:  # Restricted engine for script expressions: literals, operators, and calls to toolkit functions. No eval().
+    TOOLKIT_NAME = "tk"
+    TOOLKIT_FUNCS = {  # What scripts can call as tk.<name> -> where CoreGame.build_toolkit() finds it, starting from the CoreGame.
+        "set_hunger": "set_hunger",
+        "choose_clan": "state.playerchar.choose_clan",
+        "choose_pt": "choose_predator_type_wrapper",
+        "get_pc_attr": "state.get_pc_attr",
+        "add_background": "add_background_wrapper",
+        "get_hunt_choice_label": "state.get_hunt_choice_label",
+        "pc_can_hunt": "state.pc_can_hunt",
+        "pc_can_delay_hunt": "state.pc_can_delay_hunt",
+        "pc_can_drink_swill": "state.pc_can_drink_swill",
+        "pc_available_willpower": "available_pc_will"
+    }
+    BIN_OPS = {
+        ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+        ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod
+    }
+    UNARY_OPS = {ast.Not: operator.not_, ast.USub: operator.neg, ast.UAdd: operator.pos}
+    COMPARE_OPS = {
+        ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt,
+        ast.GtE: operator.ge, ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+        ast.Is: operator.is_, ast.IsNot: operator.is_not
+    }
+
+    def __init__(self, source):
+        self.source = source
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError("Invalid event expression \"{}\": {}".format(source, e.msg))
+        self.constant, built = self.build(tree.body)
+        self.value = built if self.constant else None  # Folded at compile time, e.g. "1 + 1 == 3" is just False.
+        self.func = None if self.constant else built
+
+    def __repr__(self):
+        return "<EventExpr \"{}\"{}>".format(self.source, " = {}".format(self.value) if self.constant else "")
+
+    def evaluate(self, toolkit):
+        return self.value if self.constant else self.func(toolkit)
+
+    def error(self, node, message):
+        return ValueError("Invalid event expression \"{}\" (column {}): {}".format(self.source, node.col_offset + 1, message))
+
+    def fold(self, node, func, *args):  # Runs an operation on constants now, so a broken one fails at load time too.
+        try:
+            return True, func(*args)
+        except Exception as e:
+            raise self.error(node, "{}: {}".format(e.__class__.__name__, e))
+
+    @staticmethod
+    def as_func(built):
+        constant, item = built
+        return (lambda tk: item) if constant else item
+
+    def build(self, node):  # Returns (True, value) for a constant, or (False, func) where func(toolkit) computes the value.
+        if isinstance(node, ast.Constant):
+            return True, node.value
+        elif isinstance(node, (ast.Tuple, ast.List)):
+            items = [self.build(elt) for elt in node.elts]
+            container = tuple if isinstance(node, ast.Tuple) else list
+            if all([constant for constant, _ in items]):
+                return True, container([value for _, value in items])
+            funcs = [EventExpr.as_func(item) for item in items]
+            return False, lambda tk: container([f(tk) for f in funcs])
+        elif isinstance(node, ast.Call):
+            return self.build_call(node)
+        elif isinstance(node, ast.BinOp) and type(node.op) in EventExpr.BIN_OPS:
+            op, left, right = EventExpr.BIN_OPS[type(node.op)], self.build(node.left), self.build(node.right)
+            if left[0] and right[0]:
+                return self.fold(node, op, left[1], right[1])
+            lf, rf = EventExpr.as_func(left), EventExpr.as_func(right)
+            return False, lambda tk: op(lf(tk), rf(tk))
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in EventExpr.UNARY_OPS:
+            op, operand = EventExpr.UNARY_OPS[type(node.op)], self.build(node.operand)
+            if operand[0]:
+                return self.fold(node, op, operand[1])
+            of = operand[1]
+            return False, lambda tk: op(of(tk))
+        elif isinstance(node, ast.BoolOp):
+            return self.build_bool_op(node)
+        elif isinstance(node, ast.Compare):
+            return self.build_compare(node)
+        elif isinstance(node, ast.IfExp):
+            test, body, orelse = self.build(node.test), self.build(node.body), self.build(node.orelse)
+            if test[0]:
+                return body if test[1] else orelse
+            tf, bf, ef = test[1], EventExpr.as_func(body), EventExpr.as_func(orelse)
+            return False, lambda tk: bf(tk) if tf(tk) else ef(tk)
+        elif isinstance(node, ast.Subscript):
+            key_node = node.slice.value if isinstance(node.slice, getattr(ast, "Index", ())) else node.slice  # Python < 3.9
+            target, key = self.build(node.value), self.build(key_node)
+            if target[0] and key[0]:
+                return self.fold(node, operator.getitem, target[1], key[1])
+            target_f, key_f = EventExpr.as_func(target), EventExpr.as_func(key)
+            return False, lambda tk: target_f(tk)[key_f(tk)]
+        elif isinstance(node, (ast.Name, ast.Attribute)):
+            raise self.error(node, "only toolkit calls like tk.pc_can_hunt() are allowed, not bare names or attributes.")
+        raise self.error(node, "{} isn't allowed in event expressions.".format(node.__class__.__name__))
+
+    def build_call(self, node):  # Calls are never folded; toolkit functions can change the game state.
+        func = node.func
+        if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id == EventExpr.TOOLKIT_NAME):
+            raise self.error(node, "only toolkit functions (tk.<name>) can be called.")
+        if func.attr.startswith("_"):  # Never dunders, whatever ends up in the toolkit.
+            raise self.error(node, "\"{}\" is private.".format(func.attr))
+        if func.attr not in EventExpr.TOOLKIT_FUNCS:
+            raise self.error(node, "\"{}\" isn't a toolkit function.".format(func.attr))
+        if any([isinstance(arg, ast.Starred) for arg in node.args]) or any([kw.arg is None for kw in node.keywords]):
+            raise self.error(node, "*args and **kwargs aren't allowed.")
+        name = func.attr
+        arg_funcs = [EventExpr.as_func(self.build(arg)) for arg in node.args]
+        kwarg_funcs = [(kw.arg, EventExpr.as_func(self.build(kw.value))) for kw in node.keywords]
+        if not arg_funcs and not kwarg_funcs:
+            return False, lambda tk: getattr(tk, name)()
+        return False, lambda tk: getattr(tk, name)(*[f(tk) for f in arg_funcs], **{k: f(tk) for k, f in kwarg_funcs})
+
+    def build_bool_op(self, node):
+        is_and, result, funcs = isinstance(node.op, ast.And), None, []
+        for constant, item in [self.build(value) for value in node.values]:  # Everything gets checked, even if folded away.
+            if constant and not funcs:  # A leading constant either decides the result or drops out.
+                if bool(item) != is_and:
+                    return True, item
+                result = item
+                continue
+            funcs.append(EventExpr.as_func((constant, item)))
+        if not funcs:
+            return True, result
+        elif len(funcs) == 1:
+            return False, funcs[0]
+
+        def run(tk):
+            value = None
+            for f in funcs:
+                value = f(tk)
+                if bool(value) != is_and:
+                    break
+            return value
+        return False, run
+
+    def build_compare(self, node):
+        operands = [self.build(node.left)] + [self.build(comp) for comp in node.comparators]
+        ops = [EventExpr.COMPARE_OPS[type(op)] for op in node.ops]
+        funcs = [EventExpr.as_func(operand) for operand in operands]
+
+        def run(tk):  # Chained like Python: stops at the first comparison that fails.
+            left = funcs[0](tk)
+            for op, f in zip(ops, funcs[1:]):
+                right = f(tk)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+        if all([constant for constant, _ in operands]):
+            return self.fold(node, run, None)
+        return False, run
+
+
+class TextTemplate:  # Blurb text, split once into literal text and {expression} segments.
+    def __init__(self, source):
+        self.source = source
+        self.segments = []  # Literal strings and EventExprs, in order.
+        pos = 0
+        while True:
+            start = source.find("{", pos)
+            end = source.find("}", start + 1) if start >= 0 else -1
+            if end < 0:
                 break
-            blurb_text += line + "\n"
-        return blurb_text, end_i
+            if start > pos:
+                self.segments.append(source[pos:start])
+            self.segments.append(EventParser.compile_expr(source[start + 1:end]))
+            pos = end + 1
+        if pos < len(source):
+            self.segments.append(source[pos:])
+        self.is_static = all([isinstance(segment, str) for segment in self.segments])
+        self.version, self.rendered = None, source if self.is_static else None
+
+    def __repr__(self):
+        return "<TextTemplate \"{}\" ({} segments)>".format(Utils.truncate_string(self.source, 30), len(self.segments))
+
+    def render(self, version, get_toolkit):  # Re-renders only when the game state version has moved on since last time.
+        if self.is_static or (version is not None and version == self.version):
+            return self.rendered
+        toolkit = get_toolkit()
+        self.rendered = "".join([
+            segment if isinstance(segment, str) else TextTemplate.as_text(segment.evaluate(toolkit)) for segment in self.segments
+        ])
+        self.version = version
+        return self.rendered
+
+    @staticmethod
+    def as_text(value):
+        return "" if value is None else str(value)
+
+
+class EventLibrary:  # eid -> where that event lives, for every script in text/ and json/, so any event loads by eid.
+    _index = {}  # eid -> ObjectWrapper(folder, file_name, start, end)
+    _handles = {}  # eid -> (etype, pickled itinerary) for JSON events that have been loaded once.
+    _files = {}  # file path -> (content hash, eids defined there), to re-index only the files that changed.
+
+    @staticmethod
+    def refresh():  # Picks up new, changed and deleted files; unchanged files cost a stat() call each.
+        seen = set()
+        for folder, ext in ((Config.PATH_TEXT_EVENTS, ".txt"), (Config.PATH_JSON_EVENTS, ".json")):
+            for file_name in sorted(listdir(folder)) if path.isdir(folder) else []:  # Shipped builds have no text/.
+                if file_name.endswith(ext):
+                    seen.add(EventLibrary.update_file(folder, file_name))
+        for file_path in [fp for fp in EventLibrary._files if fp not in seen]:
+            EventLibrary.drop_file(file_path)
 
+    @staticmethod
+    def update_file(folder, file_name):
+        file_path = path.normpath(folder + '/' + file_name)
+        digest = EventCache.get_digest(file_name, folder)
+        if file_path in EventLibrary._files and EventLibrary._files[file_path][0] == digest:
+            return file_path
+        EventLibrary.drop_file(file_path)
+        entries = []
+        try:
+            entries = EventLibrary.scan_text_file(file_name) if folder == Config.PATH_TEXT_EVENTS else EventLibrary.scan_json_file(file_name)
+        except (ValueError, OSError) as e:
+            Utils.log("{}: Couldn't index events in \"{}\".".format(e.__class__, file_name), e)
+        eids = []
+        for eid, start, end in entries:
+            if eid in EventLibrary._index:
+                Utils.log("Duplicate eid \"{}\" in \"{}\"; keeping the one in \"{}\".".format(eid, file_name, EventLibrary._index[eid].file_name))
+                continue
+            EventLibrary._index[eid] = ObjectWrapper(folder=folder, file_name=file_name, start=start, end=end)
+            eids.append(eid)
+        EventLibrary._files[file_path] = (digest, eids)
+        return file_path
+
+    @staticmethod
+    def drop_file(file_path):
+        for eid in EventLibrary._files.pop(file_path, (None, ()))[1]:
+            del EventLibrary._index[eid]
+            EventLibrary._handles.pop(eid, None)
+
+    @staticmethod
+    def scan_text_file(file_name):  # One event per script; its eid is >|event_start="eid", or else the file name.
+        with open(path.normpath(Config.PATH_TEXT_EVENTS + '/' + file_name), 'r') as script_file:
+            first_line = script_file.readline()
+        if not first_line.startswith(ScriptParser.TAG_PREFIX + "event_start"):
+            return []
+        head = ScriptParser.HEAD_PATTERN.match(first_line.rstrip("\r\n").split('|', 2)[1].strip())
+        return [(head.group(2) if head and head.group(2) else path.splitext(file_name)[0], 0, None)]
+
+    @staticmethod
+    def scan_json_file(file_name):
+        entries, items = [], Utils.stream_json_array(file_name, with_offsets=True)
+        try:
+            first = next(items)
+        except (StopIteration, ValueError):
+            return []  # Not a JSON array, e.g. char_info.json.
+        if not isinstance(first[2], dict) or Config.REF_MOMENTS not in first[2]:
+            return []  # Not an event pack, e.g. credits.json.
+        for start, end, event_data in EventLibrary.prepend(first, items):
+            if isinstance(event_data, dict) and event_data.get(Config.REF_EID):
+                entries.append((event_data[Config.REF_EID], start, end))
+        return entries
+
+    @staticmethod
+    def prepend(first, items):  # Puts the peeked item back in front without reading the rest of the pack into memory.
+        yield first
+        yield from items
+
+    @staticmethod
+    def find(eid):
+        entry = EventLibrary._index.get(eid)
+        if entry is not None:
+            file_path = path.normpath(entry.folder + '/' + entry.file_name)
+            try:
+                digest = EventCache.get_digest(entry.file_name, entry.folder)
+            except OSError:  # Deleted since it was indexed.
+                digest = None
+            if digest is None:
+                EventLibrary.drop_file(file_path)
+                entry = None
+            elif EventLibrary._files[file_path][0] != digest:
+                EventLibrary.update_file(entry.folder, entry.file_name)  # Edited since it was indexed.
+                entry = EventLibrary._index.get(eid)
+        if entry is None:
+            EventLibrary.refresh()  # Maybe it's in a new file.
+            entry = EventLibrary._index.get(eid)
+        return entry
+
+    @staticmethod
+    def load_event(eid):
+        entry, pack = EventLibrary.find(eid), ContentPack.get()
+        if entry is None:
+            if pack is not None and pack.find(eid) is not None:
+                return pack.load_event(eid)
+            raise ValueError("No event with eid \"{}\" in any script.".format(eid))
+        if entry.folder == Config.PATH_TEXT_EVENTS:
+            return EventCache.load_txt(entry.file_name, eid)  # EventCache holds the compiled form of text scripts.
+        if pack is not None and eid in pack.events and pack.is_current(entry.folder, entry.file_name):
+            return pack.load_event(eid)
+        if eid not in EventLibrary._handles:
+            event_data = Utils.read_json_item(entry.file_name, entry.start, entry.end)
+            evt = JsonEventLoader.build_event(event_data, "{}, event \"{}\"".format(entry.file_name, eid))
+            EventLibrary._handles[eid] = (evt.type, pickle.dumps(evt.itinerary, protocol=pickle.HIGHEST_PROTOCOL))
+        etype, itinerary = EventLibrary._handles[eid]
+        evt = GameEvent(etype=etype, eid=eid)
+        evt.itinerary = pickle.loads(itinerary)  # A fresh copy each time, since events get consumed as they play.
+        return evt
+
+    @staticmethod
+    def clear():
+        EventLibrary._index.clear()
+        EventLibrary._handles.clear()
+        EventLibrary._files.clear()
+
+
+class ContentPack:  # Read-only view of the content pack written by build_content_pack.py: every event, parsed and checked.
+    FILE_NAME = "content.pack"
+    MAGIC = b"VJCP"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHI")  # magic, pack version, EventCache.FORMAT_VERSION, index length
+    _pack = None
+    _checked = False
+
+    def __init__(self, buffer):
+        magic, version, format_version, index_len = ContentPack.HEADER.unpack_from(buffer)
+        if magic != ContentPack.MAGIC or version != ContentPack.VERSION or format_version != EventCache.FORMAT_VERSION:
+            raise ValueError("Not a version {} content pack for event format {}.".format(ContentPack.VERSION, EventCache.FORMAT_VERSION))
+        self.buffer = buffer
+        index = json.loads(bytes(buffer[ContentPack.HEADER.size:ContentPack.HEADER.size + index_len]).decode('utf-8'))
+        self.sources = index["sources"]  # "text/intro.txt" -> [content hash, [eids]]
+        self.events = index["events"]  # eid -> [source, etype, offset, length]
+        self.data_start = ContentPack.HEADER.size + index_len
+
+    @staticmethod
+    def get():  # The shipped pack, or None if there isn't a usable one.
+        if not ContentPack._checked:
+            ContentPack._checked = True
+            try:
+                ContentPack._pack = ContentPack(Utils.map_data_file(ContentPack.FILE_NAME))
+            except FileNotFoundError:
+                pass
+            except (ValueError, KeyError, struct.error) as e:
+                Utils.log("{}: Ignoring \"{}\"; scripts will be parsed from source.".format(e.__class__, ContentPack.FILE_NAME), e)
+        return ContentPack._pack
+
+    @staticmethod
+    def source_key(folder, file_name):
+        return "{}/{}".format(path.basename(folder), file_name)
+
+    def is_current(self, folder, file_name):  # Usable if the script isn't on disk (a shipped build) or hasn't changed.
+        known = self.sources.get(ContentPack.source_key(folder, file_name))
+        if known is None:
+            return False
+        if not path.exists(path.normpath(folder + '/' + file_name)):
+            return True
+        return known[0] == EventCache.get_digest(file_name, folder)
+
+    def find(self, eid):  # Only events whose script is missing from disk; the rest are indexed by EventLibrary.
+        entry = self.events.get(eid)
+        if entry is None:
+            return None
+        folder, file_name = entry[0].split('/', 1)
+        folder = Config.PATH_TEXT_EVENTS if folder == path.basename(Config.PATH_TEXT_EVENTS) else Config.PATH_JSON_EVENTS
+        return None if path.exists(path.normpath(folder + '/' + file_name)) else entry
+
+    def load_event(self, eid, as_eid=None):
+        source, etype, offset, length = self.events[eid]
+        start = self.data_start + offset
+        evt = GameEvent(etype=etype, eid=as_eid if as_eid else eid)
+        evt.itinerary = pickle.loads(zlib.decompress(self.buffer[start:start + length]))
+        return evt
+
+    def load_source(self, folder, file_name, as_eid=None):  # The one event in a text script.
+        return self.load_event(self.sources[ContentPack.source_key(folder, file_name)][1][0], as_eid)
+
+    @staticmethod
+    def compile_file(folder, file_name):  # Runs in a worker process. Returns (source, content hash, events, errors).
+        source, events, errors = ContentPack.source_key(folder, file_name), [], []
+        try:
+            digest = EventCache.get_digest(file_name, folder)
+            if folder == Config.PATH_TEXT_EVENTS:
+                for eid, _, _ in EventLibrary.scan_text_file(file_name):
+                    events.append((eid, "event_from_text", GameEvent.build_from_txt(file_name, eid).itinerary))
+            else:
+                for eid, start, end in EventLibrary.scan_json_file(file_name):
+                    event_data = Utils.read_json_item(file_name, start, end)
+                    evt = JsonEventLoader.build_event(event_data, "{}, event \"{}\"".format(file_name, eid))
+                    events.append((eid, evt.type, evt.itinerary))
+        except (ValueError, OSError) as e:
+            return source, None, [], [str(e)]
+        blobs = [(eid, etype, zlib.compress(pickle.dumps(itinerary, protocol=pickle.HIGHEST_PROTOCOL), 9))
+                 for eid, etype, itinerary in events]
+        return source, digest, blobs, errors
+
+    @staticmethod
+    def build(compiled):  # compiled is a list of compile_file() results; returns the pack as bytes.
+        sources, events, blobs, offset = {}, {}, [], 0
+        for source, digest, file_events, _ in sorted(compiled):
+            if not file_events:
+                continue
+            for eid, etype, blob in file_events:
+                if eid in events:
+                    raise ValueError("{}: eid \"{}\" is already used in {}.".format(source, eid, events[eid][0]))
+                events[eid] = [source, etype, offset, len(blob)]
+                blobs.append(blob)
+                offset += len(blob)
+            sources[source] = [digest, [eid for eid, _, _ in file_events]]
+        index = json.dumps({"sources": sources, "events": events}, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        header = ContentPack.HEADER.pack(ContentPack.MAGIC, ContentPack.VERSION, EventCache.FORMAT_VERSION, len(index))
+        return b"".join([header, index] + blobs)
+
+
+class EventParser:  # Script expressions go through EventExpr, never eval().
+    _compiled = {}  # expression source -> EventExpr, so each expression is only ever parsed once.
+    _templates = {}  # blurb text -> TextTemplate
+
+    @staticmethod
+    def compile_expr(expr):
+        compiled = EventParser._compiled.get(expr)
+        if compiled is None:
+            compiled = EventParser._compiled[expr] = EventExpr(expr)
+        return compiled
+
+    @staticmethod
+    def compile_template(text):  # NOTE: Version numbers are unique across GameStates, so templates can be shared.
+        template = EventParser._templates.get(text)
+        if template is None:
+            template = EventParser._templates[text] = TextTemplate(text)
+        return template
 
-class EventParser:  # TODO: mitigate some of the issues with eval being used here
     @staticmethod
     def evaluate_event_param(key: str, expression, toolkit):
         if key == Config.REF_CHOICE_SHOWN or \
@@ -292,7 +1165,7 @@ class EventParser:  # TODO: mitigate some of the issues with eval being used her
     def eval_event_bool(expr, toolkit):
         if expr is None or expr == "":  # If the expression doesn't exist or is empty, we assume it should evaluate to True.
             return True
-        evl = eval(expr, {}, {"tk": toolkit})
+        evl = EventParser.compile_expr(expr).evaluate(toolkit)
         print("BOOL EVAL RESULT from expression \"{}\": {}".format(expr, evl))
         return evl
 
@@ -300,7 +1173,7 @@ class EventParser:  # TODO: mitigate some of the issues with eval being used her
     def eval_event_text(expr, toolkit):
         if expr is None or expr == "":
             return ""
-        evl = eval(expr, {}, {"tk": toolkit})
+        evl = EventParser.compile_expr(expr).evaluate(toolkit)
         print("STRING EVAL RESULT from expression \"{}\": {}".format(expr, evl))
         return evl
 
@@ -308,7 +1181,7 @@ class EventParser:  # TODO: mitigate some of the issues with eval being used her
     def eval_event_state_change(expr, toolkit):
         if expr is None or expr == "":
             raise ValueError("Invalid expression encountered during attempted state change.")
-        evl = eval(expr, {}, {"tk": toolkit})
+        evl = EventParser.compile_expr(expr).evaluate(toolkit)
         print("state change EVAL RESULT from expression \"{}\": {}".format(expr, evl))
         return evl
 
@@ -331,7 +1204,7 @@ class StandardEvents:
     def get_standard_haven_hub_event(game):
         shhe = GameEvent("standard_haven_hub")
         status_text = "You make your way back to your haven."
-        game.gui.sm.change_screen("tab_haven")
+        game.gui.change_screen("tab_haven")
         hub_itin = shhe.itinerary
         hub_itin.append(TextBlurb(text=status_text))
         base_hub_choice = UserChoice(Config.SEM_HUB_MAIN, "What do you want to do?")
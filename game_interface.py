@@ -0,0 +1,162 @@
+from time import perf_counter
+
+from config import Config
+
+# Everything CoreGame needs from a front end. The Kivy GUI implements it in main.py (KivyGameInterface); the classes here
+# let the game loop run headless, for automated playthroughs, simulations and benchmarks on machines with no display.
+
+
+class GameInterface:
+    def show_text(self, text):
+        raise NotImplementedError()
+
+    def show_choices(self, choices, prompt):  # Dicts with text, goto and enabled_if (already evaluated), plus choice_id if any.
+        raise NotImplementedError()
+
+    def show_roll(self, roll_summary, game_roll):
+        raise NotImplementedError()
+
+    def change_screen(self, screen_name):
+        raise NotImplementedError()
+
+    def refresh_screen(self, screen_name):
+        raise NotImplementedError()
+
+    def set_hunger_overlay(self, hunger):
+        raise NotImplementedError()
+
+    def set_player_char(self, pc):
+        raise NotImplementedError()
+
+    def schedule(self, callback):  # Runs callback soon, after the front end has had a chance to update.
+        raise NotImplementedError()
+
+
+class NullGameInterface(GameInterface):  # Ignores everything; scheduled callbacks wait until run_pending().
+    def __init__(self):
+        self.pending = []
+
+    def show_text(self, text):
+        pass
+
+    def show_choices(self, choices, prompt):
+        pass
+
+    def show_roll(self, roll_summary, game_roll):
+        pass
+
+    def change_screen(self, screen_name):
+        pass
+
+    def refresh_screen(self, screen_name):
+        pass
+
+    def set_hunger_overlay(self, hunger):
+        pass
+
+    def set_player_char(self, pc):
+        pass
+
+    def schedule(self, callback):
+        self.pending.append(callback)
+
+    def run_pending(self):  # Returns how many callbacks ran.
+        num_run = 0
+        while self.pending:
+            self.pending.pop(0)()
+            num_run += 1
+        return num_run
+
+
+class RecordingGameInterface(NullGameInterface):  # Keeps what the player would see, and what they're being asked for.
+    T_TEXT, T_CHOICES, T_ROLL = "text", "choices", "roll"
+
+    def __init__(self, keep_history=True):
+        super().__init__()
+        self.keep_history = keep_history
+        self.history = []  # (call name, args)
+        self.waiting_for = None  # T_TEXT, T_CHOICES or T_ROLL, from the last thing shown.
+        self.text, self.choices, self.prompt, self.roll_summary, self.game_roll = None, [], None, None, None
+        self.num_lines, self.num_choices, self.num_rolls = 0, 0, 0
+
+    def record(self, name, *args):
+        if self.keep_history:
+            self.history.append((name, args))
+
+    def show_text(self, text):
+        self.record("show_text", text)
+        self.text, self.waiting_for = text, RecordingGameInterface.T_TEXT
+        self.num_lines += 1
+
+    def show_choices(self, choices, prompt):
+        self.record("show_choices", choices, prompt)
+        self.choices, self.prompt, self.waiting_for = choices, prompt, RecordingGameInterface.T_CHOICES
+        self.num_choices += 1
+
+    def show_roll(self, roll_summary, game_roll):
+        self.record("show_roll", roll_summary, game_roll)
+        self.roll_summary, self.game_roll, self.waiting_for = roll_summary, game_roll, RecordingGameInterface.T_ROLL
+        self.num_rolls += 1
+
+    def change_screen(self, screen_name):
+        self.record("change_screen", screen_name)
+
+    def refresh_screen(self, screen_name):
+        self.record("refresh_screen", screen_name)
+
+    def set_hunger_overlay(self, hunger):
+        self.record("set_hunger_overlay", hunger)
+
+
+class HeadlessPlayer:  # Drives a CoreGame the way MainWidget does, answering each prompt with pick_choice().
+    def __init__(self, game, interface: RecordingGameInterface, pick_choice=None):
+        self.game = game
+        self.interface = interface
+        self.pick_choice = pick_choice if pick_choice else HeadlessPlayer.first_enabled_choice
+        self.num_inputs = 0
+
+    @staticmethod
+    def first_enabled_choice(choices):
+        for choice in choices:
+            if choice.get(Config.REF_CHOICE_ENABLED, True):
+                return choice
+        return None
+
+    def settle(self):  # Lets any run of moments split across frames finish.
+        while self.interface.pending:
+            self.interface.run_pending()
+
+    def respond(self):  # Answers whatever the game is waiting for. Returns False if there's nothing left to answer.
+        waiting_for, self.interface.waiting_for = self.interface.waiting_for, None
+        if waiting_for == RecordingGameInterface.T_CHOICES:
+            choice = self.pick_choice(self.interface.choices)
+            if choice is None:
+                return False
+            self.game.current_event_repoint(target_mindex=None, target_mid=choice[Config.REF_GOTO_MOMENT])
+        elif waiting_for == RecordingGameInterface.T_ROLL:
+            self.game.confirm_roll()
+        elif waiting_for is None and not len(self.game.state.event_queue):
+            return False  # Not waiting on the player (an event just ended) and nothing else is scheduled.
+        self.num_inputs += 1
+        self.game.player_input_unblock()
+        self.settle()
+        return True
+
+    def play(self, max_moments=10000, max_seconds=None):  # Returns stats for the run, including moments per second.
+        start, first_moment = perf_counter(), self.game.num_moments
+        if not self.game.game_running():
+            self.game.load_game()
+            self.settle()
+        while self.game.num_moments - first_moment < max_moments:
+            if max_seconds is not None and perf_counter() - start >= max_seconds:
+                break
+            if not self.respond():
+                break
+        elapsed = perf_counter() - start
+        num_moments = self.game.num_moments - first_moment
+        return {
+            "moments": num_moments,
+            "inputs": self.num_inputs,
+            "seconds": elapsed,
+            "moments_per_sec": num_moments / elapsed if elapsed > 0 else 0.0
+        }
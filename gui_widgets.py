@@ -13,7 +13,8 @@ from kivy.uix.button import Button
 from kivy.uix.screenmanager import ScreenManager, Screen, FadeTransition
 
 from config import Config
-from utils import Utils
+from utils import Utils, V5DiceRoll
+from dice_odds import V5Odds
 
 
 class GuiUtils:
@@ -48,6 +49,33 @@ class GuiUtils:
                 adjusted_params.append(str(param).capitalize())
         return " + ".join([str(p) for p in adjusted_params])
 
+    @staticmethod
+    def format_roll_odds(odds):
+        if not odds:
+            return ""
+        odds_text = ["{:.0%} success".format(V5Odds.success_odds(odds))]
+        for outcome in (V5DiceRoll.RESULT_CRIT, V5DiceRoll.RESULT_MESSY_CRIT, V5DiceRoll.RESULT_BESTIAL_FAIL):
+            if odds[outcome] > 0:
+                odds_text.append("{:.0%} {}".format(odds[outcome], outcome.lower()))
+        return "Odds:  " + ", ".join(odds_text)
+
+    @staticmethod
+    def format_reroll_gain(reroll, messy_crit=False):
+        gain_text = "{:+.0%} success".format(reroll.success_gain)
+        if messy_crit:
+            return "{:.0%} still messy, {}".format(reroll.odds[V5DiceRoll.RESULT_MESSY_CRIT], gain_text)
+        return "{}, {:+.1f} margin".format(gain_text, reroll.margin_gain)
+
+    @staticmethod
+    def format_roll_history(rows):
+        lines = []
+        for row in rows:
+            dice_text = " ".join([str(dr) for dr in row.black_results] + ["[color=#ef0404]{}[/color]".format(dr) for dr in row.red_results])
+            lines.append("Roll:   {} dice vs {}  |  {}  |  {} (margin {}){}".format(
+                row.pool, row.difficulty, dice_text, row.outcome, row.margin, ", rerolled" if row.rerolled else ""
+            ))
+        return "\n".join(lines)
+
     @staticmethod
     def bonus_color(txt):
         return "[color=#23ed23]{}[/color]".format(txt)
@@ -133,14 +161,18 @@ class NullScreen(Screenlike):
 
 
 class EventScreen(Screenlike):
+    ROLL_RECORD_LINES = 8
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         print(self.ids)
         self.dice_roll_console = self.ids["dice_roll_console"]
         self.roll_readout, self.roll_record = self.ids["roll_readout"], self.ids["roll_record"]
+        self.odds_readout = self.ids["odds_readout"]
         self.dice_pool_readout, self.full_dice_result = self.ids["dice_pool_readout"], self.ids["full_dice_result"]
         self.full_dice_result.markup = self.roll_record.markup = self.dice_pool_readout.markup = True
         self.better_btn, self.no_messy_btn = self.ids["reroll_for_better"], self.ids["reroll_for_safety"]
+        self.better_gain, self.no_messy_gain = self.ids["better_gain"], self.ids["no_messy_gain"]
         self.continue_button = self.ids["continue"]
 
     def prep_roll(self):
@@ -148,6 +180,10 @@ class EventScreen(Screenlike):
         # self.no_messy_btn.disabled = True
         self.continue_button.disabled = False
 
+    def show_reroll_advice(self, advice=None):
+        self.better_gain.text = GuiUtils.format_reroll_gain(advice.better) if advice and not self.better_btn.disabled else ""
+        self.no_messy_gain.text = GuiUtils.format_reroll_gain(advice.no_messy, True) if advice and not self.no_messy_btn.disabled else ""
+
     def on_click_continue(self):
         self.gui.advance_via_roll_continue_btn()
 
@@ -409,6 +445,9 @@ class DevConsole(BoxLayout):
         self.gui = gui
         self.dev_readout = self.ids["dev_readout"]
 
+    def update_roll_stats(self, roll_history):
+        self.dev_readout.text = roll_history.summary()
+
 
 class DarkPackDisclaimer(AnchorLayout):
     pass
@@ -0,0 +1,39 @@
+import argparse
+import builtins
+import sys
+from os import environ
+
+environ.setdefault("KIVY_NO_ARGS", "1")  # Kivy would otherwise take our command line arguments as its own.
+environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from core_game import CoreGame
+from game_interface import RecordingGameInterface, HeadlessPlayer
+
+# Plays the game with no GUI, always picking the first enabled choice, and reports how fast moments get processed:
+#   python headless_game.py --moments 20000
+
+
+def run(max_moments, max_seconds=None, quiet=True):
+    interface = RecordingGameInterface(keep_history=False)
+    game = CoreGame(interface)
+    real_print = builtins.print
+    if quiet:
+        builtins.print = lambda *args, **kwargs: None  # The game loop is chatty; printing would be most of what we measure.
+    try:
+        stats = HeadlessPlayer(game, interface).play(max_moments=max_moments, max_seconds=max_seconds)
+    finally:
+        builtins.print = real_print
+    stats.update(lines=interface.num_lines, choices=interface.num_choices, rolls=interface.num_rolls)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play the game headless and report moments per second.")
+    parser.add_argument("--moments", type=int, default=10000, help="stop after this many moments")
+    parser.add_argument("--seconds", type=float, default=None, help="stop after this long")
+    parser.add_argument("--verbose", action="store_true", help="keep the game's own logging")
+    args = parser.parse_args()
+    results = run(args.moments, args.seconds, quiet=not args.verbose)
+    print("{moments} moments ({lines} lines, {choices} choices, {rolls} rolls) in {seconds:.2f}s: "
+          "{moments_per_sec:.0f} moments/sec".format(**results))
+    sys.exit(0 if results["moments"] else 1)
@@ -12,6 +12,7 @@ KivyConfig.set('graphics', 'width', str(GAME_WINDOW_WIDTH))
 KivyConfig.set('graphics', 'height', str(GAME_WINDOW_HEIGHT))
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.core.window import Window
 from kivy.resources import resource_add_path  # , resource_find
 from kivy.uix.floatlayout import FloatLayout
@@ -21,6 +22,8 @@ from gui_widgets import MainGuiFrame, MainConsole, DevConsole, ScreenJuggler, Ma
     EventScreen
 from config import Config
 from core_game import CoreGame
+from game_interface import GameInterface
+from dice_odds import V5Odds
 from audio import AudioHandler, init_audio
 
 
@@ -99,14 +102,18 @@ class MainWidget(FloatLayout):
         full_result_text += delim + delim.join(["[color=#ef0404]< {} >[/color]".format(dr) for dr in self.temp_roll.red_results])
         self.dice_box.dice_pool_readout.text = pool_readout
         self.dice_box.roll_readout.text = roll_result
+        self.dice_box.odds_readout.text = GuiUtils.format_roll_odds(getattr(self.temp_summary, "odds", None))
         self.dice_box.full_dice_result.text = full_result_text
-        self.dice_box.roll_record.text += "Roll:   " + "  |  ".join([pool_readout, full_result_text, roll_result]) + "\n"
+        self.dice_box.roll_record.text = GuiUtils.format_roll_history(self.game.roll_history.recent(EventScreen.ROLL_RECORD_LINES))
+        if Config.DEV_MODE:
+            self.dev_console.update_roll_stats(self.game.roll_history)
         if self.game.available_pc_will() > 0:
             self.dice_box.better_btn.disabled = not self.temp_summary.can_reroll_to_improve or self.temp_roll.rerolled
             self.dice_box.no_messy_btn.disabled = not self.temp_summary.can_reroll_to_avert_mc or self.temp_roll.rerolled
         else:
             self.dice_box.better_btn.disabled = True
             self.dice_box.no_messy_btn.disabled = True
+        self.dice_box.show_reroll_advice(V5Odds.reroll_advice(self.temp_roll) if not self.temp_roll.rerolled else None)
 
     def reroll_from_main(self, messy_crit=False):
         self.game.reroll(messy_crit=messy_crit)
@@ -154,6 +161,38 @@ class MainWidget(FloatLayout):
         quit()
 
 
+class KivyGameInterface(GameInterface):  # What CoreGame sees of the Kivy GUI.
+    def __init__(self, gui: MainWidget):
+        self.gui = gui
+
+    def show_text(self, text):
+        self.gui.main_text.read_line(text)
+
+    def show_choices(self, choices, prompt):
+        self.gui.main_text.prep_choices()
+        self.gui.main_text.create_choice_labels(choices, prompt)
+
+    def show_roll(self, roll_summary, game_roll):
+        self.gui.main_text.prep_roll()
+        self.gui.dice_box.prep_roll()
+        self.gui.display_roll(roll_summary, game_roll)
+
+    def change_screen(self, screen_name):
+        self.gui.sm.change_screen(screen_name)
+
+    def refresh_screen(self, screen_name):
+        self.gui.refresh_screen(screen_name)
+
+    def set_hunger_overlay(self, hunger):
+        self.gui.set_hunger_overlay(hunger)
+
+    def set_player_char(self, pc):
+        self.gui.pc_ref = pc
+
+    def schedule(self, callback):
+        Clock.schedule_once(lambda dt: callback(), 0)
+
+
 class VtmJamSofaBaronApp(App):
     CUSTOM_RED = GuiUtils.SOFA_BARON_RED
 
@@ -166,7 +205,7 @@ class VtmJamSofaBaronApp(App):
         self.gui = MainWidget()
         self.gui.audio = AudioHandler()
         init_audio(self.gui.audio)
-        self.gui.game = self.game = CoreGame(self.gui)
+        self.gui.game = self.game = CoreGame(KivyGameInterface(self.gui))
         self.gui.sm = ScreenJuggler(self.gui)
         self.gui.stem = MainGuiFrame(self.gui)
         self.gui.overlay = OverlayFrame()
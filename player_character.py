@@ -22,6 +22,7 @@ class Tracker:
     @boxes.setter
     def boxes(self, new_num_boxes: int):
         self._boxes = new_num_boxes
+        self.playerchar.changed()
 
     @property
     def armor(self):  # Blocks superficial damage prior to halving.
@@ -32,6 +33,7 @@ class Tracker:
     @armor.setter
     def armor(self, new_armor_val):
         self._armor = new_armor_val
+        self.playerchar.changed()
 
     @property
     def bonus(self):
@@ -42,6 +44,7 @@ class Tracker:
     @bonus.setter
     def bonus(self, new_bonus: int):
         self._bonus = new_bonus
+        self.playerchar.changed()
 
     def damage(self, dtype, amount):
         total_boxes = self.boxes + self.bonus
@@ -86,6 +89,7 @@ class Tracker:
         elif injured:
             # renpy.sound.queue(audio.stab2, u'sound')
             pass
+        self.playerchar.changed()
 
     def mend(self, dtype, amount):
         if dtype == Config.DMG_SPF or dtype == Config.DMG_FULL_SPF:
@@ -94,10 +98,12 @@ class Tracker:
         else:
             damage = self.agg_damage
             self.agg_damage = max(damage - amount, 0)
+        self.playerchar.changed()
 
 
 class PlayerChar:
     def __init__(self, anames, snames, dnames):
+        self.on_change = None  # Set by the owning GameState, to bump its version whenever anything here changes.
         self.nickname = "That lick from around the way"
         self.pronouns = {}  # TODO: implement this
         self.clan = None
@@ -129,6 +135,7 @@ class PlayerChar:
             self.hunger = Config.HUNGER_MAX
         else:
             Utils.log("Hunger now set at {}".format(self.hunger))
+        self.changed()
 
     @property
     def humanity(self):
@@ -137,11 +144,16 @@ class PlayerChar:
     @humanity.setter
     def humanity(self, new_humanity):
         self._humanity = new_humanity
+        self.changed()
 
     @property
     def backgrounds(self):
         return self._backgrounds
 
+    def changed(self):  # Every method that modifies the character calls this.
+        if self.on_change:
+            self.on_change()
+
     def reset_charsheet_stats(self):
         for aname in self.anames:
             self.attrs[aname] = Config.MIN_SCORE_ATTR
@@ -150,12 +162,14 @@ class PlayerChar:
         for dname in self.dnames:
             self.available_disciplines[dname] = Config.VAL_DISC_LOCKED
             self.discipline_levels[dname] = Config.MIN_SCORE
+        self.changed()
 
     def validate_charsheet_stats(self):
         for aname in self.anames:
             self.attrs[aname] = max(Config.MIN_SCORE_ATTR, min(self.attrs[aname], Config.MAX_SCORE))
         for sname in self.snames:
             self.skills[sname] = max(Config.MIN_SCORE, min(self.skills[sname], Config.MAX_SCORE))
+        self.changed()
 
     def recalculate_stats(self):
         self.reset_charsheet_stats()
@@ -185,6 +199,7 @@ class PlayerChar:
         if isinstance(background, str):
             bg = Config.CHAR_BACKGROUNDS[background]
         self._backgrounds.append(bg)
+        self.changed()
         self.recalculate_stats()
 
     def apply_xp(self):
@@ -195,6 +210,7 @@ class PlayerChar:
             self.crippled = impaired
         elif tracker_type == Config.TRACK_WILL:
             self.shocked = impaired
+        self.changed()
 
     def get_fort_resilience_bonus(self):
         if Config.POWER_FORTITUDE_HP not in self.powers:
@@ -226,9 +242,11 @@ class PlayerChar:
             # self.clan_blurbs[Config.REF_CLAN_CHOSEN] = "You have certain... dietary restrictions. It's not easy being a picky vampire."
         else:
             raise ValueError("Invalid clan \"{}\".".format(clan))
+        self.changed()
 
     def choose_predator_type(self, pt):
         self.predator_type = pt
+        self.changed()
         if pt == Config.PT_ALLEYCAT:
             self.humanity -= 1
         elif pt == Config.PT_FARMER:
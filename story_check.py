@@ -0,0 +1,225 @@
+import json
+import sys
+from os import listdir, makedirs, path, replace
+
+from config import Config
+from utils import Utils, ObjectWrapper
+from game_events import GameEvent, Moment, JsonEventLoader, EventCache, EventLibrary
+
+# Whole-story goto check over every event script in text/ and json/:
+#   python story_check.py    lists dangling gotos, unreachable moments and loops with no way out; exit code 1 if any
+
+
+class StoryGraph:  # Directed graph of moments for each event, linked by blurb/choice/roll/state change gotos.
+    VERSION = 2  # Bump this whenever the analysis changes, so cached results get recomputed.
+    CACHE_FILE = "story_graph.json"
+    EXIT = -1  # Leaving the event, either by running off its end or by jumping to another event.
+    _results = None  # "folder/file" -> {"digest": ..., "result": ...}, loaded from the cache file on first use.
+
+    @staticmethod
+    def moment_label(evt, index):
+        moment = evt.itinerary[index]
+        return moment.mid if moment.mid is not None else "#{} ({})".format(index + 1, moment.type)
+
+    @staticmethod
+    def get_targets(evt, index):  # Every mid (or EXIT, or the next index) this moment can hand over to.
+        moment, itin = evt.itinerary[index], evt.itinerary
+        mtype = Moment.validate_mtype(str(moment.type).lower())
+        next_node = index + 1 if index + 1 < len(itin) else StoryGraph.EXIT
+        if mtype == Moment.M_USER_CHOICE:
+            return [choice[Config.REF_GOTO_MOMENT] for choice in moment.choices]
+        elif mtype == Moment.M_DICE_ROLL:  # Same fallbacks as CoreGame.confirm_roll().
+            targets = [moment.mid_win if moment.mid_win else next_node, moment.mid_lose if moment.mid_lose else next_node]
+            return targets + [mid for mid in (moment.mid_crit, moment.mid_messycrit, moment.mid_beastfail) if mid]
+        elif mtype == Moment.M_JUMP_2_EVENT:
+            return [StoryGraph.EXIT]
+        goto = getattr(moment, Config.REF_GOTO_MOMENT, None)
+        return [goto if goto else next_node]
+
+    @staticmethod
+    def analyze_event(evt):
+        num_moments, edges, dangling, jumps = len(evt.itinerary), [], [], []
+        for i in range(num_moments):
+            nodes = []
+            for target in StoryGraph.get_targets(evt, i):
+                node = target if isinstance(target, int) else evt.itinerary.find(target)
+                if node is None:
+                    dangling.append([StoryGraph.moment_label(evt, i), target])
+                else:
+                    nodes.append(node)
+            edges.append(nodes)
+            if evt.itinerary[i].type == Moment.M_JUMP_2_EVENT:
+                jumps.append([StoryGraph.moment_label(evt, i), evt.itinerary[i].destination_eid])
+        reachable = StoryGraph.search([0] if num_moments else [], edges)
+        reverse = [[] for _ in range(num_moments)]
+        exits = []
+        for i, nodes in enumerate(edges):
+            for node in nodes:
+                if node == StoryGraph.EXIT:
+                    exits.append(i)
+                else:
+                    reverse[node].append(i)
+        can_exit = StoryGraph.search(exits, reverse)
+        stuck = [i for i in range(num_moments) if reachable[i] and not can_exit[i]]
+        return {
+            "eid": evt.eid,
+            "moments": num_moments,
+            "dangling": dangling,
+            "unreachable": [StoryGraph.moment_label(evt, i) for i in range(num_moments) if not reachable[i]],
+            "stuck_cycles": [[StoryGraph.moment_label(evt, i) for i in cycle] for cycle in StoryGraph.find_cycles(stuck, edges)],
+            "jumps": jumps
+        }
+
+    @staticmethod
+    def search(starts, edges):  # Marks every node reachable from starts.
+        seen, stack = [False] * len(edges), list(starts)
+        for node in stack:
+            seen[node] = True
+        while stack:
+            for node in edges[stack.pop()]:
+                if node != StoryGraph.EXIT and not seen[node]:
+                    seen[node] = True
+                    stack.append(node)
+        return seen
+
+    @staticmethod
+    def find_cycles(nodes, edges):  # Strongly connected components among nodes (iterative Tarjan), keeping actual loops.
+        allowed, index_of, low, on_stack, stack, cycles, counter = set(nodes), {}, {}, set(), [], [], 0
+        for root in nodes:
+            if root in index_of:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, edge_i = work.pop()
+                if edge_i == 0:
+                    index_of[node] = low[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack.add(node)
+                successors = [n for n in edges[node] if n in allowed]
+                if edge_i < len(successors):
+                    work.append((node, edge_i + 1))
+                    succ = successors[edge_i]
+                    if succ not in index_of:
+                        work.append((succ, 0))
+                    elif succ in on_stack:
+                        low[node] = min(low[node], index_of[succ])
+                    continue
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index_of[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in edges[node]:
+                        cycles.append(sorted(component))
+        return cycles
+
+    @staticmethod
+    def load_events(folder, file_name):  # Returns a list of events, or None if the file isn't an event script/pack.
+        if folder == Config.PATH_TEXT_EVENTS:
+            entries = EventLibrary.scan_text_file(file_name)  # Same eid EventLibrary will load it by.
+            if not entries:
+                return None
+            return [GameEvent.build_from_txt(file_name, eid=entries[0][0])]
+        items = Utils.stream_json_array(file_name)
+        try:
+            first = next(items)
+        except (StopIteration, ValueError):
+            return None
+        if not isinstance(first, dict) or Config.REF_MOMENTS not in first:
+            return None
+        events = [JsonEventLoader.build_event(first, "{}, event #1".format(file_name))]
+        for i, event_data in enumerate(items):
+            events.append(JsonEventLoader.build_event(event_data, "{}, event #{}".format(file_name, i + 2)))
+        return events
+
+    @staticmethod
+    def analyze_file(folder, file_name):
+        try:
+            events = StoryGraph.load_events(folder, file_name)
+        except (ValueError, OSError) as e:
+            return {"script": True, "events": [], "errors": [str(e)]}
+        if events is None:
+            return {"script": False, "events": [], "errors": []}
+        return {"script": True, "events": [StoryGraph.analyze_event(evt) for evt in events], "errors": []}
+
+    @staticmethod
+    def get_cache_path():
+        return path.normpath(Config.PATH_CACHE + '/' + StoryGraph.CACHE_FILE)
+
+    @staticmethod
+    def load_cache():
+        if StoryGraph._results is None:
+            StoryGraph._results = {}
+            try:
+                with open(StoryGraph.get_cache_path(), 'r') as cache_file:
+                    cached = json.load(cache_file)
+                if cached.get("version") == StoryGraph.VERSION:
+                    StoryGraph._results = cached["files"]
+            except (OSError, ValueError, KeyError, AttributeError):
+                pass
+        return StoryGraph._results
+
+    @staticmethod
+    def save_cache():
+        cache_path = StoryGraph.get_cache_path()
+        try:
+            makedirs(Config.PATH_CACHE, exist_ok=True)
+            with open(cache_path + ".tmp", 'w') as cache_file:
+                json.dump({"version": StoryGraph.VERSION, "files": StoryGraph._results}, cache_file)
+            replace(cache_path + ".tmp", cache_path)
+        except OSError as e:
+            Utils.log("{}: Couldn't save story graph results; they'll be recomputed next time.".format(e.__class__), e)
+
+    @staticmethod
+    def check_story():
+        results, seen, num_analyzed = StoryGraph.load_cache(), set(), 0
+        for folder, ext in ((Config.PATH_TEXT_EVENTS, ".txt"), (Config.PATH_JSON_EVENTS, ".json")):
+            for file_name in sorted(listdir(folder)):
+                if not file_name.endswith(ext):
+                    continue
+                key = "{}/{}".format(path.basename(folder), file_name)
+                digest = EventCache.get_digest(file_name, folder)
+                seen.add(key)
+                if key not in results or results[key]["digest"] != digest:
+                    results[key] = {"digest": digest, "result": StoryGraph.analyze_file(folder, file_name)}
+                    num_analyzed += 1
+        for key in [key for key in results if key not in seen]:
+            del results[key]
+        if num_analyzed:
+            StoryGraph.save_cache()
+        return StoryGraph.summarize(results, num_analyzed)
+
+    @staticmethod
+    def summarize(results, num_analyzed):
+        known_eids = set(GameEvent.STANDARD_EIDS)
+        for entry in results.values():
+            known_eids.update([event["eid"] for event in entry["result"]["events"]])
+        problems, scripts = [], [key for key in sorted(results) if results[key]["result"]["script"]]
+        for key in scripts:
+            result = results[key]["result"]
+            problems += ["{}: {}".format(key, error) for error in result["errors"]]
+            for event in result["events"]:
+                where = "{} [{}]".format(key, event["eid"])
+                problems += ["{}: \"{}\" goes to missing mid \"{}\"".format(where, src, target) for src, target in event["dangling"]]
+                problems += ["{}: \"{}\" can never be reached".format(where, label) for label in event["unreachable"]]
+                problems += ["{}: no way out of the loop {}".format(where, " -> ".join(cycle)) for cycle in event["stuck_cycles"]]
+                problems += ["{}: \"{}\" jumps to unknown event \"{}\"".format(where, src, eid)
+                             for src, eid in event["jumps"] if eid not in known_eids]
+        return ObjectWrapper(scripts=scripts, problems=problems, num_analyzed=num_analyzed, num_cached=len(results) - num_analyzed)
+
+
+if __name__ == '__main__':
+    report = StoryGraph.check_story()
+    for problem in report.problems:
+        print(problem)
+    print("{} scripts checked ({} files unchanged since the last run): {} problems.".format(
+        len(report.scripts), report.num_cached, len(report.problems)
+    ))
+    sys.exit(1 if report.problems else 0)
@@ -0,0 +1,42 @@
+import shutil
+import tempfile
+import unittest
+from os import path, remove
+from unittest import mock
+
+from config import Config
+from game_events import EventCache, EventLibrary
+
+
+class EventLibraryDeletedFileTest(unittest.TestCase):  # A script deleted after it was indexed is just a changed file.
+    TEST_FILE = "zz_copy.txt"
+
+    def setUp(self):
+        with open(path.normpath(Config.PATH_TEXT_EVENTS + '/intro.txt'), 'r') as script_file:
+            lines = script_file.readlines()
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_path = path.join(self.temp_dir, EventLibraryDeletedFileTest.TEST_FILE)
+        with open(self.test_path, 'w') as script_file:
+            script_file.writelines(['>|event_start="zzcopy"\n'] + lines[1:])
+        for name in ("PATH_TEXT_EVENTS", "PATH_JSON_EVENTS", "PATH_CACHE"):
+            patcher = mock.patch.object(Config, name, self.temp_dir)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        EventLibrary.clear()
+        EventCache.clear()
+
+    def tearDown(self):
+        EventLibrary.clear()
+        EventCache.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_deleted_script_is_dropped(self):
+        self.assertEqual(EventLibrary.load_event("zzcopy").eid, "zzcopy")
+        remove(self.test_path)
+        with self.assertRaises(ValueError):  # Not FileNotFoundError from stat().
+            EventLibrary.load_event("zzcopy")
+        self.assertIsNone(EventLibrary.find("zzcopy"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import builtins
+import unittest
+from os import environ
+
+environ.setdefault("KIVY_NO_ARGS", "1")
+environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from config import Config
+from core_game import CoreGame
+from game_events import GameEvent, StateChange
+from game_interface import RecordingGameInterface
+
+
+class EventContinuationTest(unittest.TestCase):  # A run split across frames logs its errors instead of raising them.
+    class NullLog:
+        def record(self, text):
+            pass
+
+    def test_first_step_of_continuation_is_logged(self):
+        interface = RecordingGameInterface(keep_history=False)
+        game = CoreGame(interface)
+        game.log = EventContinuationTest.NullLog()
+        event = GameEvent(etype="test", eid="continuation_test")
+        event.itinerary = [StateChange(mid="step_{}".format(i), expr="tk.pc_can_hunt()") for i in range(Config.EVENT_STEPS_PER_FRAME)]
+        event.itinerary.append(StateChange(mid="bad_step", expr="tk.choose_clan('nope')"))
+        game.state.event_queue.schedule(event)
+        game.state.current_event = event
+        printed, real_print = [], builtins.print
+        builtins.print = lambda *args, **kwargs: printed.append(args)
+        try:
+            game.game_loop()
+            self.assertTrue(interface.pending)
+            interface.run_pending()  # Raised before the fix.
+        finally:
+            builtins.print = real_print
+        self.assertFalse(game.state.busy)
+        self.assertTrue(any("Unexplained" in str(args[0]) for args in printed if args))
+
+
+if __name__ == '__main__':
+    unittest.main()
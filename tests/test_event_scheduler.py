@@ -0,0 +1,29 @@
+import unittest
+from os import environ
+
+environ.setdefault("KIVY_NO_ARGS", "1")
+environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from core_game import EventScheduler, InGameClock
+
+
+class EventSchedulerRescheduleTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = InGameClock(100)
+        self.queue = EventScheduler(self.clock)
+
+    def test_keeps_time_and_priority_by_default(self):
+        self.queue.schedule("later", at=160, priority=2)
+        self.queue.reschedule("later")
+        self.assertEqual(self.queue.get_time("later"), 160)
+        self.queue.reschedule("later", at=130)
+        self.assertEqual(self.queue.get_time("later"), 130)
+        self.assertEqual(self.queue._entries["later"][1], 2)
+
+    def test_unscheduled_event_starts_now(self):
+        self.queue.reschedule("new")
+        self.assertEqual(self.queue.get_time("new"), self.clock.time)
+
+
+if __name__ == '__main__':
+    unittest.main()
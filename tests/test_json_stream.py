@@ -0,0 +1,37 @@
+import json
+import shutil
+import tempfile
+import unittest
+from os import path
+from unittest import mock
+
+from config import Config
+from utils import Utils
+
+
+class JsonStreamOffsetTest(unittest.TestCase):  # Offsets from stream_json_array() are raw file bytes, whatever the line endings.
+    TEST_FILE = "crlf_stream_test.json"
+
+    def setUp(self):
+        items = [{"eid": "e{}".format(i), "text": "Café — “{}” ünïcode".format(i)} for i in range(20)]
+        self.temp_dir = tempfile.mkdtemp()
+        with open(path.join(self.temp_dir, JsonStreamOffsetTest.TEST_FILE), 'w', encoding='utf-8', newline='') as json_file:
+            json_file.write(json.dumps(items, indent=2, ensure_ascii=False).replace("\n", "\r\n"))
+        self.items = items
+        for name in ("PATH_JSON", "PATH_JSON_EVENTS"):
+            patcher = mock.patch.object(Config, name, self.temp_dir)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_crlf_offsets_read_back(self):
+        streamed = list(Utils.stream_json_array(JsonStreamOffsetTest.TEST_FILE, chunk_size=64, with_offsets=True))
+        self.assertEqual([item for _, _, item in streamed], self.items)
+        for start, end, item in streamed:
+            self.assertEqual(Utils.read_json_item(JsonStreamOffsetTest.TEST_FILE, start, end), item)
+
+
+if __name__ == '__main__':
+    unittest.main()
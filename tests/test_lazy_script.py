@@ -0,0 +1,62 @@
+import shutil
+import tempfile
+import unittest
+from os import path
+from unittest import mock
+
+from config import Config
+from game_events import GameEvent, LazyScript, EventCache
+
+
+class LazyScriptLineEndingTest(unittest.TestCase):  # LazyScript and the eager ScriptParser must agree on CRLF scripts too.
+    TEST_FILE = "crlf_lazy_test.txt"
+
+    def setUp(self):
+        with open(path.normpath(Config.PATH_TEXT_EVENTS + '/intro.txt'), 'r', newline='') as script_file:
+            script = script_file.read().replace("\r\n", "\n")
+        self.temp_dir = tempfile.mkdtemp()
+        with open(path.join(self.temp_dir, LazyScriptLineEndingTest.TEST_FILE), 'w', newline='') as script_file:
+            script_file.write(script.replace("\n", "\r\n"))
+        patcher = mock.patch.object(Config, "PATH_TEXT_EVENTS", self.temp_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_crlf_lazy_matches_eager(self):
+        eager = GameEvent.build_from_txt(LazyScriptLineEndingTest.TEST_FILE, "crlf").itinerary
+        lazy = LazyScript(LazyScriptLineEndingTest.TEST_FILE).load_event("crlf").itinerary
+        self.assertEqual(len(eager), len(lazy))
+        self.assertEqual([vars(moment) for moment in eager], [vars(moment) for moment in lazy])
+
+
+class LazyScriptCheckTest(unittest.TestCase):  # Big scripts get the same load-time checks as small ones.
+    TEST_FILE = "bad_blurb_test.txt"
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open(path.join(self.temp_dir, LazyScriptCheckTest.TEST_FILE), 'w') as script_file:
+            script_file.write(">|event_start\n\nFine so far.\n\nThis one isn't: {open('x')}\n\n>|event_end\n")
+        for name, value in (("PATH_TEXT_EVENTS", self.temp_dir), ("PATH_CACHE", self.temp_dir)):
+            patcher = mock.patch.object(Config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(EventCache, "LAZY_MIN_BYTES", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        EventCache.clear()
+
+    def tearDown(self):
+        EventCache.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_bad_expression_fails_at_load_time(self):
+        with self.assertRaises(ValueError):
+            GameEvent.build_from_txt(LazyScriptCheckTest.TEST_FILE, "bad")
+        with self.assertRaises(ValueError):
+            EventCache.load_txt(LazyScriptCheckTest.TEST_FILE, "bad")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+from os import environ
+
+environ.setdefault("KIVY_NO_ARGS", "1")
+environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from core_game import CoreGame
+from game_events import EventExpr, TextTemplate
+from game_interface import NullGameInterface
+
+
+class ToolkitNamesTest(unittest.TestCase):  # Scripts can call exactly what CoreGame puts in the toolkit.
+    def test_names_come_from_the_toolkit(self):
+        game = CoreGame(NullGameInterface())
+        self.assertEqual(set(EventExpr.TOOLKIT_FUNCS), set(vars(game.get_exposed_funcs())))
+        for name in EventExpr.TOOLKIT_FUNCS:
+            EventExpr("tk.{}()".format(name))  # Compiled, not run, so arguments don't matter.
+
+    def test_unknown_and_private_names_fail_to_compile(self):
+        for source in ("tk.not_a_toolkit_function()", 'tk.__setattr__("pc_can_hunt", 5)', "tk.__import__('os')"):
+            with self.assertRaises(ValueError):
+                EventExpr(source)
+        with self.assertRaises(ValueError):
+            TextTemplate("{tk.__import__('os')}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
 import string
 import json
+import mmap
 from os import path
-from random import randint, choices as random_choices
-from kivy import platform
+from array import array
+from random import Random, randint, choices as random_choices
 from config import Config
 
 
@@ -84,6 +85,68 @@ class Utils:
             data = json.load(read_file)
             return data
 
+    @staticmethod
+    def stream_json_array(file_name, chunk_size=1 << 16, with_offsets=False):
+        # Yields the items of a top-level JSON array one at a time, or (start byte, end byte, item) with_offsets.
+        file_path = path.normpath(Config.PATH_JSON + '/' + file_name)
+        decoder, whitespace = json.JSONDecoder(), " \t\r\n"
+        with open(file_path, 'r', encoding='utf-8', newline='') as read_file:  # No newline translation; offsets are raw bytes.
+            buffer, pos, read_size, started, need_comma, num_items = "", 0, chunk_size, False, False, 0
+            mark = [0, 0]  # [index in buffer, its byte offset in the file], so byte offsets are counted incrementally.
+
+            def byte_offset(index):
+                if with_offsets:
+                    mark[1] += len(buffer[mark[0]:index].encode('utf-8'))
+                    mark[0] = index
+                return mark[1]
+            while True:
+                while pos < len(buffer) and buffer[pos] in whitespace:
+                    pos += 1
+                if pos == len(buffer):
+                    chunk = read_file.read(read_size)
+                    if not chunk:
+                        raise ValueError("{}: File ends before the closing ] (after {} items).".format(file_name, num_items))
+                    byte_offset(pos)
+                    buffer, pos, mark[0] = buffer[pos:] + chunk, 0, 0
+                    continue
+                char = buffer[pos]
+                if not started:
+                    if char != "[":
+                        raise ValueError("{}: Expected a JSON array.".format(file_name))
+                    started, pos = True, pos + 1
+                elif char == "]" and (need_comma or num_items == 0):
+                    return
+                elif need_comma:
+                    if char != ",":
+                        raise ValueError("{}: Expected , or ] after item #{}.".format(file_name, num_items))
+                    need_comma, pos = False, pos + 1
+                else:
+                    try:
+                        item, end = decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError as e:
+                        item, end = e, None
+                    if end is None or end == len(buffer):  # Possibly cut off at the end of the buffer; read more and retry.
+                        chunk = read_file.read(read_size)
+                        if chunk:
+                            byte_offset(pos)
+                            buffer, pos, mark[0], read_size = buffer[pos:] + chunk, 0, 0, read_size * 2  # Doubling keeps big items linear.
+                            continue
+                        if end is None:
+                            raise ValueError("{}: Item #{}: {}".format(file_name, num_items + 1, item))
+                    num_items += 1
+                    if with_offsets:
+                        yield byte_offset(pos), byte_offset(end), item
+                    else:
+                        yield item
+                    pos, read_size, need_comma = end, chunk_size, True
+
+    @staticmethod
+    def read_json_item(file_name, start, end):  # Reads back one item found by stream_json_array(with_offsets=True).
+        file_path = path.normpath(Config.PATH_JSON + '/' + file_name)
+        with open(file_path, 'rb') as read_file:
+            read_file.seek(start)
+            return json.loads(read_file.read(end - start).decode('utf-8'))
+
     @staticmethod
     def read_text_from_file(file_name, mode='r'):
         file_path = path.normpath(Config.PATH_TEXT_EVENTS + '/' + file_name)
@@ -91,6 +154,18 @@ class Utils:
             data = read_file.readlines()
             return data
 
+    @staticmethod
+    def map_text_file(file_name):  # Read-only memory map of an event script, for parsing it lazily.
+        file_path = path.normpath(Config.PATH_TEXT_EVENTS + '/' + file_name)
+        with open(file_path, 'rb') as text_file:
+            return mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def map_data_file(file_name):  # Read-only memory map, so large data files are paged in instead of copied.
+        file_path = path.normpath(Config.PATH_DATA + '/' + file_name)
+        with open(file_path, 'rb') as data_file:
+            return mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
     @staticmethod
     def get_image_file_path(file_name, image_type="gui"):
         if image_type == "gui":
@@ -109,6 +184,7 @@ class Utils:
 
     @staticmethod
     def get_platform():
+        from kivy import platform  # NOTE: Imported here so the dice code (and its benchmarks) can run without Kivy.
         return platform
 
     @staticmethod
@@ -139,6 +215,50 @@ class Utils:
         print(*args)
 
 
+class DiceStream:  # Seedable d10 source. Faces are drawn in bulk into a buffer, instead of one randint() call per die.
+    D10_FACES = range(1, 11)
+    BUFFER_SIZE = 1024
+
+    _default = None
+
+    def __init__(self, seed=None, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.rng = Random(seed)
+        self._buffer, self._index = [], 0
+
+    @staticmethod
+    def default():  # Used by any roll made without a stream, e.g. outside of a CoreGame.
+        if DiceStream._default is None:
+            DiceStream._default = DiceStream()
+        return DiceStream._default
+
+    def reseed(self, seed):
+        self.seed = seed
+        self.rng.seed(seed)
+        self._buffer, self._index = [], 0
+
+    def refill(self, min_size=0):
+        leftover = self._buffer[self._index:]
+        self._buffer = leftover + self.rng.choices(DiceStream.D10_FACES, k=max(self.buffer_size, min_size))
+        self._index = 0
+
+    def roll(self, num_dice):
+        if num_dice <= 0:
+            return []
+        if self._index + num_dice > len(self._buffer):
+            self.refill(num_dice)
+        faces = self._buffer[self._index:self._index + num_dice]
+        self._index += num_dice
+        return faces
+
+    def roll_one(self):
+        if self._index >= len(self._buffer):
+            self.refill()
+        self._index += 1
+        return self._buffer[self._index - 1]
+
+
 class V5DiceRoll:
     D10_WIN_INC = 6
     D10_MAX = 10
@@ -149,7 +269,10 @@ class V5DiceRoll:
     RESULT_CRIT = "Critical"
     RESULT_MESSY_CRIT = "Messy Critical"
 
-    def __init__(self, pool, difficulty, hunger=1, include_hunger=True):
+    OUTCOMES = (RESULT_BESTIAL_FAIL, RESULT_FAIL, RESULT_WIN, RESULT_CRIT, RESULT_MESSY_CRIT)  # Index = outcome code for batch().
+
+    def __init__(self, pool, difficulty, hunger=1, include_hunger=True, dice=None):
+        dice = dice if dice else DiceStream.default()
         self.hunger = int(hunger) if include_hunger else 0
         self.pool, self.difficulty = int(pool), int(difficulty)
         self.opp_ws = None
@@ -160,10 +283,10 @@ class V5DiceRoll:
         self.black_failures = self.num_successes = 0
         self.outcome, self.margin = None, 0
         self.black_pool = pool - max(self.hunger, 0) if include_hunger else pool
-        self.black_results = Utils.make_dice_roll(V5DiceRoll.D10_MAX, self.black_pool)
+        self.black_results = dice.roll(self.black_pool)
         self.included_hunger = include_hunger
         if self.included_hunger:
-            self.red_results = Utils.make_dice_roll(V5DiceRoll.D10_MAX, min(self.hunger, self.pool))
+            self.red_results = dice.roll(min(self.hunger, self.pool))
         self.calculate()
 
     def calculate(self):
@@ -176,6 +299,7 @@ class V5DiceRoll:
             self.red_ones = len([one for one in self.red_results if one < 2])
             successes += red_successes
         self.num_successes = len(successes)
+        self.crit = False  # Reset in case a reroll took away the second ten.
         if self.red_tens + self.black_tens > 1:
             self.crit = True
             self.num_successes += (self.red_tens + self.black_tens)
@@ -193,9 +317,140 @@ class V5DiceRoll:
             else:
                 self.outcome = V5DiceRoll.RESULT_FAIL
 
+    @staticmethod
+    def batch(pool, difficulty, hunger=1, n=None, include_hunger=True, rng=None, dice=None):
+        # Vectorized version of __init__() + calculate() for balance runs. Pools, difficulties and hunger can be scalars or
+        # equal-length arrays. Outcomes come back as codes, so V5DiceRoll.OUTCOMES[code] gives the usual result string.
+        import numpy as np  # NOTE: Only needed for simulations, so the game itself doesn't depend on NumPy.
+        if rng is None:  # Seeded from the dice stream, so a seeded session reproduces its simulations too.
+            rng = np.random.default_rng((dice if dice else DiceStream.default()).rng.getrandbits(64))
+        pools, diffs = np.asarray(pool, dtype=np.int64), np.asarray(difficulty, dtype=np.int64)
+        hungers = np.asarray(hunger, dtype=np.int64) if include_hunger else np.zeros(1, dtype=np.int64)
+        if n is None:
+            n = max(pools.size, diffs.size, hungers.size)
+        pools, diffs, hungers = [np.broadcast_to(arr.ravel(), (n,)) for arr in (pools, diffs, hungers)]
+        black_pools = np.maximum(pools - np.maximum(hungers, 0), 0)
+        red_pools = np.maximum(np.minimum(hungers, pools), 0)
+        black = V5DiceRoll._batch_faces(rng, black_pools)
+        red = V5DiceRoll._batch_faces(rng, red_pools)
+        return V5DiceRoll.batch_from_faces(black, red, diffs, include_hunger)
+
+    @staticmethod
+    def _batch_faces(rng, dice_counts):
+        # One row per roll; columns past that roll's dice count are zeroed, and a zero face never counts for anything.
+        import numpy as np
+        width = int(dice_counts.max()) if dice_counts.size else 0
+        faces = rng.integers(1, V5DiceRoll.D10_MAX + 1, size=(dice_counts.size, width), dtype=np.int8)
+        faces[np.arange(width) >= dice_counts[:, None]] = 0
+        return faces
+
+    @staticmethod
+    def batch_from_faces(black_faces, red_faces, difficulty, include_hunger=True):
+        # Same rules as calculate(), applied to 2D arrays of black and red dice faces (one row per roll, 0 = no die).
+        import numpy as np
+        black_faces, red_faces = np.asarray(black_faces), np.asarray(red_faces)
+        tens = (black_faces >= V5DiceRoll.D10_MAX).sum(axis=1)
+        successes = (black_faces >= V5DiceRoll.D10_WIN_INC).sum(axis=1)
+        if include_hunger:
+            red_tens = (red_faces >= V5DiceRoll.D10_MAX).sum(axis=1)
+            red_ones = (red_faces == 1).sum(axis=1)
+            successes = successes + (red_faces >= V5DiceRoll.D10_WIN_INC).sum(axis=1)
+        else:
+            red_tens = red_ones = np.zeros_like(tens)
+        tens = tens + red_tens
+        crit = tens > 1
+        successes = successes + np.where(crit, tens, 0)
+        margin = successes - np.asarray(difficulty)
+        won = margin >= 0
+        messy = won & crit & (red_tens > 0)
+        bestial = ~won & (red_ones > 0)
+        outcome = np.select(
+            [bestial, ~won, messy, crit],
+            [V5DiceRoll.OUTCOMES.index(V5DiceRoll.RESULT_BESTIAL_FAIL), V5DiceRoll.OUTCOMES.index(V5DiceRoll.RESULT_FAIL),
+             V5DiceRoll.OUTCOMES.index(V5DiceRoll.RESULT_MESSY_CRIT), V5DiceRoll.OUTCOMES.index(V5DiceRoll.RESULT_CRIT)],
+            default=V5DiceRoll.OUTCOMES.index(V5DiceRoll.RESULT_WIN)
+        ).astype(np.int8)
+        return ObjectWrapper(
+            outcome=outcome, margin=margin, num_successes=successes, crit=crit, messy=messy, bestial=bestial
+        )
+
+
+class V5Roll:  # Compact V5DiceRoll for the game and long roll histories: face-count histograms, and no per-roll __dict__.
+    __slots__ = (
+        "pool", "difficulty", "hunger", "included_hunger", "black_pool", "black_faces", "red_faces", "black_tens",
+        "black_failures", "red_tens", "red_ones", "num_successes", "crit", "outcome", "margin", "rerolled", "opp_ws"
+    )
+
+    def __init__(self, pool, difficulty, hunger=1, include_hunger=True, dice=None):
+        dice = dice if dice else DiceStream.default()
+        self.hunger = int(hunger) if include_hunger else 0
+        self.pool, self.difficulty = int(pool), int(difficulty)
+        self.included_hunger = include_hunger
+        self.opp_ws = None
+        self.rerolled = False
+        self.black_pool = self.pool - max(self.hunger, 0) if include_hunger else self.pool
+        self.black_faces = V5Roll.histogram(dice.roll(self.black_pool))  # Index = face, value = how many dice show it.
+        self.red_faces = V5Roll.histogram(dice.roll(min(self.hunger, self.pool)) if include_hunger else ())
+        self.calculate()
+
+    @staticmethod
+    def histogram(faces):
+        counts = array('B', bytes(V5DiceRoll.D10_MAX + 1))
+        for face in faces:
+            counts[face] += 1
+        return counts
+
+    @staticmethod
+    def expand(counts):  # Highest faces first.
+        return [face for face in range(V5DiceRoll.D10_MAX, 0, -1) for _ in range(counts[face])]
+
+    @property
+    def black_results(self):
+        return V5Roll.expand(self.black_faces)
+
+    @property
+    def red_results(self):
+        return V5Roll.expand(self.red_faces)
+
+    def calculate(self):  # Same rules as V5DiceRoll.calculate(), read straight off the histograms.
+        black_successes = sum(self.black_faces[V5DiceRoll.D10_WIN_INC:])
+        self.black_failures = self.black_pool - black_successes
+        self.black_tens = self.black_faces[V5DiceRoll.D10_MAX]
+        self.num_successes = black_successes
+        if self.included_hunger:
+            self.red_tens, self.red_ones = self.red_faces[V5DiceRoll.D10_MAX], self.red_faces[1]
+            self.num_successes += sum(self.red_faces[V5DiceRoll.D10_WIN_INC:])
+        else:
+            self.red_tens = self.red_ones = 0
+        self.crit = self.red_tens + self.black_tens > 1
+        if self.crit:
+            self.num_successes += (self.red_tens + self.black_tens)
+        self.margin = self.num_successes - self.difficulty
+        if self.margin >= 0:
+            if self.red_tens > 0 and self.crit:
+                self.outcome = V5DiceRoll.RESULT_MESSY_CRIT
+            elif self.crit:
+                self.outcome = V5DiceRoll.RESULT_CRIT
+            else:
+                self.outcome = V5DiceRoll.RESULT_WIN
+        elif self.red_ones > 0:
+            self.outcome = V5DiceRoll.RESULT_BESTIAL_FAIL
+        else:
+            self.outcome = V5DiceRoll.RESULT_FAIL
+
+    def reroll_black(self, faces, num_dice, dice):  # Rerolls up to num_dice black dice showing any of faces, in place.
+        for face in faces:
+            taken = min(num_dice, self.black_faces[face])
+            self.black_faces[face] -= taken
+            num_dice -= taken
+            for new_face in dice.roll(taken):
+                self.black_faces[new_face] += 1
+        self.calculate()
+
 
 class DiceRoller:
-    def __init__(self):
+    def __init__(self, dice=None):
+        self.dice = dice if dice else DiceStream.default()
         self.current_roll = None
         self.current_opp_roll = None
         self.can_reroll_to_improve = False
@@ -204,41 +459,33 @@ class DiceRoller:
 
     def test(self, pool, difficulty, hunger=1, include_hunger=True):
         self.current_opp_roll = None
-        self.current_roll = V5DiceRoll(int(pool), int(difficulty), hunger=hunger, include_hunger=include_hunger)
-        if self.current_roll.black_failures > 0:
-            self.can_reroll_to_improve = True
-        if self.current_roll.outcome == V5DiceRoll.RESULT_MESSY_CRIT and self.current_roll.red_tens < 2 and self.current_roll.black_tens < 4:
-            self.can_reroll_to_avert_mc = True
+        self.current_roll = V5Roll(int(pool), int(difficulty), hunger=hunger, include_hunger=include_hunger, dice=self.dice)
+        self.check_rerolls()
         return self.current_roll
 
     def contest(self, pool1, pool2, hunger=1, include_hunger=True):
-        self.current_opp_roll = V5DiceRoll(int(pool2), 0, include_hunger=False)
-        self.current_roll = V5DiceRoll(int(pool1), self.current_opp_roll.num_successes, hunger=hunger, include_hunger=include_hunger)
+        self.current_opp_roll = V5Roll(int(pool2), 0, include_hunger=False, dice=self.dice)
+        self.current_roll = V5Roll(
+            int(pool1), self.current_opp_roll.num_successes, hunger=hunger, include_hunger=include_hunger, dice=self.dice
+        )
         margin = self.current_roll.num_successes - self.current_opp_roll.num_successes
         self.current_roll.margin = margin
         self.current_roll.opp_ws = self.current_opp_roll.num_successes
-        if margin >= 0:
-            self.player_wins = True
-        if self.current_roll.black_failures > 0:
-            self.can_reroll_to_improve = True
-        if self.current_roll.outcome == V5DiceRoll.RESULT_MESSY_CRIT and self.current_roll.red_tens < 2 and self.current_roll.black_tens < 4:
-            self.can_reroll_to_avert_mc = True
+        self.player_wins = margin >= 0
+        self.check_rerolls()
         return self.current_roll
 
+    def check_rerolls(self):  # Reroll options are worked out fresh for every new roll.
+        self.can_reroll_to_improve = self.current_roll.black_failures > 0
+        self.can_reroll_to_avert_mc = self.current_roll.outcome == V5DiceRoll.RESULT_MESSY_CRIT and \
+            self.current_roll.red_tens < 2 and self.current_roll.black_tens < 4
+
     def reroll_fails(self):
         if self.current_roll.rerolled:
             raise ValueError("Should not be able to reroll a single roll more than once.")
         self.current_roll.rerolled = True
         num_rerolls = min(3, self.current_roll.black_failures)
-        for i, d10result in enumerate(self.current_roll.black_results):
-            if num_rerolls <= 0:
-                break
-            if d10result < V5DiceRoll.D10_WIN_INC:
-                tmp = Utils.make_dice_roll(V5DiceRoll.D10_MAX, 1)[0]
-                print("rerolling a {} at i = {}, and it's now a {}".format(self.current_roll.black_results[i], i, tmp))
-                self.current_roll.black_results[i] = tmp
-                num_rerolls -= 1
-        self.current_roll.calculate()
+        self.current_roll.reroll_black(range(1, V5DiceRoll.D10_WIN_INC), num_rerolls, self.dice)
         return self.current_roll
 
     def reroll_messy_crit(self):
@@ -248,12 +495,5 @@ class DiceRoller:
             raise ValueError("This option should only be available if there's a messy critical.")
         self.current_roll.rerolled = True
         num_rerolls = min(3, self.current_roll.black_tens)
-        for i, d10result in enumerate(self.current_roll.black_results):
-            if num_rerolls <= 0:
-                break
-            if d10result == V5DiceRoll.D10_MAX:
-                self.current_roll.black_results[i] = Utils.make_dice_roll(V5DiceRoll.D10_MAX, 1)[0]
-                num_rerolls -= 1
-        self.current_roll.calculate()
+        self.current_roll.reroll_black((V5DiceRoll.D10_MAX,), num_rerolls, self.dice)
         return self.current_roll
-
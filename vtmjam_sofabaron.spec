@@ -28,7 +28,7 @@ a = Analysis(
     [get_path('main.py')],
     pathex=[],
     binaries=[],
-    datas=[(get_path('audio'), 'audio'), (get_path('images'), 'images'), (get_path('json'), 'json'), (get_path('text'), 'text')],
+    datas=[(get_path('audio'), 'audio'), (get_path('images'), 'images'), (get_path('json'), 'json'), (get_path('data'), 'data')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -43,7 +43,7 @@ pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
 exe = EXE(
     pyz,
-    Tree(get_path('')),
+    Tree(get_path(''), excludes=['text', 'cache']),  # Events ship in data/content.pack (build_content_pack.py).
     a.scripts,
     a.binaries,
     a.zipfiles,